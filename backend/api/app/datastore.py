@@ -1,8 +1,10 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import json
 import os
-from typing import List, Dict, Any
+import time
+from typing import List, Dict, Any, Union
 
 from aws_lambda_powertools import Logger
 import boto3
@@ -10,36 +12,51 @@ import botocore
 from mypy_boto3_dynamodb import DynamoDBServiceResource, DynamoDBClient
 from mypy_boto3_dynamodb.paginator import QueryPaginator
 from mypy_boto3_dynamodb.service_resource import Table
-from dynamodb_encryption_sdk.encrypted.table import EncryptedTable
-from dynamodb_encryption_sdk.identifiers import CryptoAction
-from dynamodb_encryption_sdk.material_providers.aws_kms import AwsKmsCryptographicMaterialsProvider
-from dynamodb_encryption_sdk.structures import AttributeActions
-from mypy_boto3_dynamodb.service_resource import Table
 
-from app import constants
+from app import constants, utils
 
-__all__ = ["check_institution", "delete_transactions"]
+__all__ = [
+    "check_institution",
+    "delete_transactions",
+    "get_cached_user_by_item",
+    "remember_item_user",
+    "forget_item_user",
+    "get_webhook_key",
+    "put_webhook_key",
+]
 
-KEY_ARN = os.getenv("KEY_ARN")
 TABLE_NAME = os.getenv("TABLE_NAME")
-STAGE = os.getenv("STAGE")
+# Item to user mappings learned by this container, used to stamp webhooks with a user
+ITEM_USER_CACHE_SIZE = int(os.getenv("ITEM_USER_CACHE_SIZE", "1024"))
+ITEM_USER_CACHE_TTL = float(os.getenv("ITEM_USER_CACHE_TTL", "3600"))  # seconds
 
 logger = Logger(child=True)
 
 dynamodb: DynamoDBServiceResource = boto3.resource("dynamodb", config=constants.BOTO3_CONFIG)
 table: Table = dynamodb.Table(TABLE_NAME)
-aws_kms_cmp = AwsKmsCryptographicMaterialsProvider(key_id=KEY_ARN)
-default_action = CryptoAction.ENCRYPT_AND_SIGN if (STAGE == 'prod') else CryptoAction.DO_NOTHING
-actions = AttributeActions(
-    default_action=default_action,
-    attribute_actions={constants.TOKEN_ATTRIBUTE_NAME: CryptoAction.ENCRYPT_AND_SIGN},
-)
-encrypted_table = EncryptedTable(
-    table=table,
-    materials_provider=aws_kms_cmp,
-    attribute_actions=actions,
-)
 dynamodb_client: DynamoDBClient = dynamodb.meta.client
+item_user_cache = utils.LRUCache(max_size=ITEM_USER_CACHE_SIZE, ttl=ITEM_USER_CACHE_TTL)
+
+
+def remember_item_user(item_id: str, user_id: str) -> None:
+    """
+    Cache the owner of an item once it has been stored
+    """
+    item_user_cache.set(item_id, user_id)
+
+
+def forget_item_user(item_id: str) -> None:
+    """
+    Remove the cached owner of an item after it has been deleted
+    """
+    item_user_cache.invalidate(item_id)
+
+
+def get_cached_user_by_item(item_id: str) -> Union[str, None]:
+    """
+    Return the owner of an item if this container already knows it
+    """
+    return item_user_cache.get(item_id)
 
 
 def check_institution(user_id: str, institution_id: str) -> bool:
@@ -68,6 +85,51 @@ def check_institution(user_id: str, institution_id: str) -> bool:
     return bool(response.get("Item", False))
 
 
+def get_webhook_key(key_id: str) -> Union[Dict[str, Any], None]:
+    """
+    Return the stored webhook verification key record for a key ID
+
+    Returns None if nothing is stored or the record has expired.
+    """
+    params = {
+        "Key": {
+            "pk": "WEBHOOK_KEY",
+            "sk": f"KEY#{key_id}",
+        },
+    }
+
+    try:
+        response = table.get_item(**params)
+    except botocore.exceptions.ClientError:
+        logger.exception("Unable to get webhook key from DynamoDB")
+        raise
+
+    item = response.get("Item")
+    # TTL deletion is not immediate, so expired records are ignored here
+    if not item or "key" not in item or item["expire_at"] <= time.time():
+        return None
+
+    return {"key": json.loads(item["key"])}
+
+
+def put_webhook_key(key_id: str, key: Dict[str, Any], ttl: int) -> None:
+    """
+    Store a webhook verification key for ttl seconds
+    """
+    item = {
+        "pk": "WEBHOOK_KEY",
+        "sk": f"KEY#{key_id}",
+        "expire_at": int(time.time()) + ttl,
+        "key": json.dumps(key),
+    }
+
+    try:
+        table.put_item(Item=item)
+    except botocore.exceptions.ClientError:
+        logger.exception("Unable to put webhook key to DynamoDB")
+        raise
+
+
 def delete_items(user_id: str, item_id: str) -> None:
     params = {
         "TableName": TABLE_NAME,
@@ -113,8 +175,11 @@ def get_item(user_id: str, item_id: str) -> Dict[str, Any]:
     }
     logger.debug(params)
 
+    # dynamodb_encryption_sdk is only loaded by routes that read encrypted items
+    from app import encryption
+
     try:
-        response = encrypted_table.get_item(**params)
+        response = encryption.get_encrypted_table().get_item(**params)
     except botocore.exceptions.ClientError as error:
         if error.response["Error"]["Code"] == "ResourceNotFoundException":
             raise f"Item {item_id} not found in DynamoDB"
@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from functools import partial
+import os
+import threading
+from typing import Any, Callable, Dict, Hashable, Tuple, Union
+
+from aws_lambda_powertools import Logger, Metrics
+from aws_lambda_powertools.metrics import MetricUnit
+import boto3
+from dynamodb_encryption_sdk.encrypted.client import EncryptedClient
+from dynamodb_encryption_sdk.encrypted.table import EncryptedTable
+from dynamodb_encryption_sdk.identifiers import CryptoAction
+from dynamodb_encryption_sdk.internal.utils import encrypt_put_item
+from dynamodb_encryption_sdk.material_providers import CryptographicMaterialsProvider
+from dynamodb_encryption_sdk.material_providers.aws_kms import AwsKmsCryptographicMaterialsProvider
+from dynamodb_encryption_sdk.materials import DecryptionMaterials, EncryptionMaterials
+from dynamodb_encryption_sdk.structures import AttributeActions, EncryptionContext
+from mypy_boto3_dynamodb import DynamoDBServiceResource
+
+from app import constants, utils
+
+__all__ = [
+    "CachingMaterialsProvider",
+    "build_materials_provider",
+    "get_materials_provider",
+    "get_encrypted_table",
+    "encrypt_item",
+]
+
+KEY_ARN = os.getenv("KEY_ARN")
+TABLE_NAME = os.getenv("TABLE_NAME")
+STAGE = os.getenv("STAGE")
+
+# Maximum number of cached materials and how long (in seconds) they may be reused
+KMS_CACHE_SIZE = int(os.getenv("KMS_CACHE_SIZE", "256"))
+KMS_CACHE_MAX_AGE = float(os.getenv("KMS_CACHE_MAX_AGE", "300"))
+
+logger = Logger(child=True)
+metrics = Metrics()
+
+
+class CachingMaterialsProvider(CryptographicMaterialsProvider):
+    """
+    Cryptographic materials provider that caches the materials returned by
+    another provider, so warm containers can reuse data keys instead of calling
+    KMS for every encrypted read or write.
+
+    The AWS KMS provider binds each data key to the table name and the key
+    attributes of the item, so materials are only ever reused for the same
+    item. Decryption materials are additionally keyed on the material
+    description, which holds the wrapped data key.
+    """
+
+    def __init__(
+        self,
+        materials_provider: CryptographicMaterialsProvider,
+        cache_size: int = KMS_CACHE_SIZE,
+        max_age: float = KMS_CACHE_MAX_AGE,
+    ) -> None:
+        self._materials_provider = materials_provider
+        self._encryption_cache = utils.LRUCache(max_size=cache_size, ttl=max_age)
+        self._decryption_cache = utils.LRUCache(max_size=cache_size, ttl=max_age)
+
+    @staticmethod
+    def _item_key(encryption_context: EncryptionContext) -> Tuple[Hashable, ...]:
+        attributes = encryption_context.attributes or {}
+        return (
+            encryption_context.table_name,
+            repr(attributes.get(encryption_context.partition_key_name)),
+            repr(attributes.get(encryption_context.sort_key_name)),
+        )
+
+    def decryption_materials(self, encryption_context: EncryptionContext) -> DecryptionMaterials:
+        description = encryption_context.material_description or {}
+        key = self._item_key(encryption_context) + tuple(sorted(description.items()))
+
+        materials: Union[DecryptionMaterials, None] = self._decryption_cache.get(key)
+        if materials is not None:
+            metrics.add_metric(name="KmsCacheHit", unit=MetricUnit.Count, value=1)
+            return materials
+
+        metrics.add_metric(name="KmsCacheMiss", unit=MetricUnit.Count, value=1)
+        materials = self._materials_provider.decryption_materials(encryption_context)
+        self._decryption_cache.set(key, materials)
+        return materials
+
+    def encryption_materials(self, encryption_context: EncryptionContext) -> EncryptionMaterials:
+        key = self._item_key(encryption_context)
+
+        materials: Union[EncryptionMaterials, None] = self._encryption_cache.get(key)
+        if materials is not None:
+            metrics.add_metric(name="KmsCacheHit", unit=MetricUnit.Count, value=1)
+            return materials
+
+        metrics.add_metric(name="KmsCacheMiss", unit=MetricUnit.Count, value=1)
+        materials = self._materials_provider.encryption_materials(encryption_context)
+        self._encryption_cache.set(key, materials)
+        return materials
+
+    def refresh(self) -> None:
+        self._encryption_cache.clear()
+        self._decryption_cache.clear()
+        self._materials_provider.refresh()
+
+
+def build_materials_provider(key_id: str) -> CryptographicMaterialsProvider:
+    """
+    Return the KMS materials provider, wrapped in a cache unless caching is disabled
+    """
+    aws_kms_cmp = AwsKmsCryptographicMaterialsProvider(key_id=key_id)
+
+    if KMS_CACHE_SIZE <= 0 or KMS_CACHE_MAX_AGE <= 0:
+        logger.debug("KMS materials caching is disabled")
+        return aws_kms_cmp
+
+    return CachingMaterialsProvider(aws_kms_cmp)
+
+
+class _EncryptionService:
+    """
+    Lazily built encryption clients shared by every request in a warm container
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._dynamodb: Union[DynamoDBServiceResource, None] = None
+        self._materials_provider: Union[CryptographicMaterialsProvider, None] = None
+        self._encrypted_table: Union[EncryptedTable, None] = None
+        self._encrypt_item: Union[Callable[..., Dict[str, Any]], None] = None
+
+    def _get_dynamodb(self) -> DynamoDBServiceResource:
+        if self._dynamodb is None:
+            self._dynamodb = boto3.resource("dynamodb", config=constants.BOTO3_CONFIG)
+        return self._dynamodb
+
+    def _get_materials_provider(self) -> CryptographicMaterialsProvider:
+        if self._materials_provider is None:
+            self._materials_provider = build_materials_provider(KEY_ARN)
+        return self._materials_provider
+
+    def get_materials_provider(self) -> CryptographicMaterialsProvider:
+        with self._lock:
+            return self._get_materials_provider()
+
+    def get_encrypted_table(self) -> EncryptedTable:
+        with self._lock:
+            if self._encrypted_table is None:
+                default_action = (
+                    CryptoAction.ENCRYPT_AND_SIGN if (STAGE == "prod") else CryptoAction.DO_NOTHING
+                )
+                actions = AttributeActions(
+                    default_action=default_action,
+                    attribute_actions={
+                        constants.TOKEN_ATTRIBUTE_NAME: CryptoAction.ENCRYPT_AND_SIGN
+                    },
+                )
+                self._encrypted_table = EncryptedTable(
+                    table=self._get_dynamodb().Table(TABLE_NAME),
+                    materials_provider=self._get_materials_provider(),
+                    attribute_actions=actions,
+                )
+            return self._encrypted_table
+
+    def get_item_encryptor(self) -> Callable[..., Dict[str, Any]]:
+        with self._lock:
+            if self._encrypt_item is None:
+                actions = AttributeActions(
+                    default_action=CryptoAction.DO_NOTHING,
+                    attribute_actions={
+                        constants.TOKEN_ATTRIBUTE_NAME: CryptoAction.ENCRYPT_AND_SIGN
+                    },
+                )
+                encrypted_client = EncryptedClient(
+                    client=self._get_dynamodb().meta.client,
+                    materials_provider=self._get_materials_provider(),
+                    attribute_actions=actions,
+                    expect_standard_dictionaries=True,
+                )
+
+                def return_item(**kwargs) -> Dict[str, Any]:
+                    return kwargs.get("Item")
+
+                # encrypt_put_item hands the encrypted request to a write method,
+                # which here just returns the encrypted item for a transaction
+                self._encrypt_item = partial(
+                    encrypt_put_item,
+                    encrypted_client._encrypt_item,
+                    encrypted_client._item_crypto_config,
+                    return_item,
+                )
+            return self._encrypt_item
+
+
+_service = _EncryptionService()
+
+
+def get_materials_provider() -> CryptographicMaterialsProvider:
+    """
+    Return the shared (cached) KMS materials provider
+    """
+    return _service.get_materials_provider()
+
+
+def get_encrypted_table() -> EncryptedTable:
+    """
+    Return the shared EncryptedTable used to read encrypted items
+    """
+    return _service.get_encrypted_table()
+
+
+def encrypt_item(item: Dict[str, Any], table_name: str = TABLE_NAME) -> Dict[str, Any]:
+    """
+    Return an encrypted copy of an item, ready to use in a transactional write
+    """
+    return _service.get_item_encryptor()(TableName=table_name, Item=item)
@@ -1,6 +1,11 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+from app import profiling
+
+# Started before any other import so every module is timed when profiling is enabled
+profiling.start()
+
 import os
 from typing import Dict, Any
 
@@ -26,6 +31,8 @@ resolver.include_router(routers.tokens_router, prefix="/v1/tokens")
 resolver.include_router(routers.webhook_router, prefix="/v1/webhook")
 resolver.include_router(routers.analyze_router, prefix="/v1/analyze")
 
+profiling.stop()
+
 
 @metrics.log_metrics(capture_cold_start_metric=True)
 @tracer.capture_lambda_handler
@@ -33,4 +40,5 @@ resolver.include_router(routers.analyze_router, prefix="/v1/analyze")
     correlation_id_path=correlation_paths.API_GATEWAY_HTTP, log_event=True
 )
 def handler(event: Dict[str, Any], context: LambdaContext) -> Dict[str, Any]:
+    profiling.report(metrics)
     return resolver.resolve(event, context)
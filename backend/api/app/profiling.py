@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Import-time profiler, similar to ``python -X importtime`` but reported as metrics
+
+Only uses the standard library so it can be started before any other import.
+"""
+
+import builtins
+import os
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+__all__ = ["IMPORT_PROFILING", "start", "stop", "top", "report"]
+
+# Enable to report the import cost of each top-level module on cold start
+IMPORT_PROFILING = os.getenv("IMPORT_PROFILING", "false").lower() == "true"
+
+# Number of most expensive modules reported as individual metrics
+IMPORT_PROFILING_TOP = int(os.getenv("IMPORT_PROFILING_TOP", "10"))
+
+_original_import: Callable[..., Any] = builtins.__import__
+_local = threading.local()
+_durations: Dict[str, float] = {}
+_started_at = 0.0
+_total = 0.0
+
+
+def _timed_import(name: str, globals=None, locals=None, fromlist=(), level=0):
+    depth: int = getattr(_local, "depth", 0)
+
+    # only time the outermost import of a module that has not been loaded yet,
+    # so each duration includes everything that module pulled in
+    if depth or level or name in sys.modules:
+        _local.depth = depth + 1
+        try:
+            return _original_import(name, globals, locals, fromlist, level)
+        finally:
+            _local.depth = depth
+
+    _local.depth = 1
+    started = time.perf_counter()
+    try:
+        return _original_import(name, globals, locals, fromlist, level)
+    finally:
+        _local.depth = 0
+        module = name.partition(".")[0]
+        _durations[module] = _durations.get(module, 0.0) + time.perf_counter() - started
+
+
+def start() -> None:
+    """
+    Start timing imports, if profiling is enabled
+    """
+    global _started_at
+
+    if not IMPORT_PROFILING or builtins.__import__ is _timed_import:
+        return
+
+    _started_at = time.perf_counter()
+    builtins.__import__ = _timed_import
+
+
+def stop() -> None:
+    """
+    Stop timing imports
+    """
+    global _total
+
+    if builtins.__import__ is _timed_import:
+        builtins.__import__ = _original_import
+        _total = time.perf_counter() - _started_at
+
+
+def top(limit: int = IMPORT_PROFILING_TOP) -> List[Tuple[str, float]]:
+    """
+    Return the most expensive top-level modules and their import time in seconds
+    """
+    return sorted(_durations.items(), key=lambda item: item[1], reverse=True)[:limit]
+
+
+def report(metrics) -> None:
+    """
+    Add the collected import timings to a Metrics instance, once per container
+    """
+    if not _durations:
+        return
+
+    from aws_lambda_powertools.metrics import MetricUnit
+
+    metrics.add_metric(name="ImportTime", unit=MetricUnit.Milliseconds, value=_total * 1000)
+    for module, duration in top():
+        metrics.add_metric(
+            name=f"ImportTime_{module}", unit=MetricUnit.Milliseconds, value=duration * 1000
+        )
+
+    metrics.add_metadata(
+        key="import_times_ms",
+        value={module: round(duration * 1000, 2) for module, duration in top(len(_durations))},
+    )
+    _durations.clear()
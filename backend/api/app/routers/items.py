@@ -62,6 +62,11 @@ def post_refresh(item_id: str) -> Dict[str, Any]:
                 "DataType": "String",
                 "StringValue": user_id,
             },
+            # user requested refreshes bypass the balance refresh throttle
+            "ForceRefresh": {
+                "DataType": "String",
+                "StringValue": "true",
+            },
         },
         "MessageBody": "{}",  # needs to be an empty JSON body
         "MessageDeduplicationId": user_id + "BALANCE_DEFAULT_UPDATE" + item_id,
@@ -219,6 +224,7 @@ def delete_item(item_id: str) -> Response:
         metrics.add_metric(name="DeleteItemFailed", unit=MetricUnit.Count, value=1)
         # raise
 
+    datastore.forget_item_user(item_id)
     datastore.delete_items(user_id, item_id)
 
     response = Response(status_code=204, content_type=content_types.APPLICATION_JSON, body="")
@@ -1,4 +1,3 @@
-import yfinance as yf
 import os
 from typing import Dict, Any, Union
 
@@ -39,6 +38,9 @@ def get_closing_prices(tickers: list, period: str, interval: str) -> Dict[str, A
     # Convert date strings to datetime objects
 
     # Retrieve stock data using yfinance
+    # yfinance is heavy, so it is only imported by the route that needs it
+    import yfinance as yf
+
     try:
 
         print(
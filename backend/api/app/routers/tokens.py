@@ -1,7 +1,6 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-from functools import partial
 import os
 from typing import Dict, Union
 
@@ -13,38 +12,18 @@ from aws_lambda_powertools.event_handler.exceptions import (
     InternalServerError,
     BadRequestError,
 )
+from aws_lambda_powertools.utilities.validation.exceptions import SchemaValidationError
 import boto3
 import botocore
-from dynamodb_encryption_sdk.encrypted.client import EncryptedClient
-from dynamodb_encryption_sdk.identifiers import CryptoAction
-from dynamodb_encryption_sdk.material_providers.aws_kms import AwsKmsCryptographicMaterialsProvider
-from dynamodb_encryption_sdk.structures import AttributeActions
-from dynamodb_encryption_sdk.internal.utils import encrypt_put_item
 from mypy_boto3_dynamodb import DynamoDBServiceResource, DynamoDBClient
 from mypy_boto3_dynamodb.service_resource import Table
-import plaid
-from plaid.model.link_token_create_request import LinkTokenCreateRequest
-from plaid.model.link_token_create_request_user import LinkTokenCreateRequestUser
-from plaid.model.link_token_create_response import LinkTokenCreateResponse
-from plaid.model.item_public_token_exchange_request import ItemPublicTokenExchangeRequest
-from plaid.model.item_public_token_exchange_response import ItemPublicTokenExchangeResponse
-from plaid.model.products import Products
-from plaid.model.country_code import CountryCode
-from plaid.model.transfer_user_in_request import TransferUserInRequest
-from plaid.model.transfer_intent_create_request import TransferIntentCreateRequest
-from plaid.model.transfer_capabilities_get_request import TransferCapabilitiesGetRequest
-from plaid.model.transfer_intent_create_mode import TransferIntentCreateMode
-from plaid.model.transfer_intent_create_network import TransferIntentCreateNetwork
-from plaid.model.ach_class import ACHClass
 import json
-from app import utils, constants, datastore, exceptions
+from app import utils, constants, datastore, exceptions, schemas
 import uuid
-from plaid.model.transfer_metadata import TransferMetadata
 __all__ = ["router"]
 
 TABLE_NAME = os.getenv("TABLE_NAME")
 WEBHOOK_URL = os.getenv("WEBHOOK_URL")
-KEY_ARN = os.getenv("KEY_ARN")
 
 tracer = Tracer()
 logger = Logger(child=True)
@@ -57,6 +36,14 @@ dynamodb: DynamoDBServiceResource = boto3.resource("dynamodb", config=constants.
 @router.get("/")
 @tracer.capture_method(capture_response=False)
 def create_link_token() -> Dict[str, str]:
+    # Plaid models are imported on first use to keep API cold starts fast
+    import plaid
+    from plaid.model.country_code import CountryCode
+    from plaid.model.link_token_create_request import LinkTokenCreateRequest
+    from plaid.model.link_token_create_request_user import LinkTokenCreateRequestUser
+    from plaid.model.link_token_create_response import LinkTokenCreateResponse
+    from plaid.model.products import Products
+
     user_id: str = utils.authorize_request(router)
 
     logger.append_keys(user_id=user_id)
@@ -90,6 +77,14 @@ def create_link_token() -> Dict[str, str]:
 @router.get("/get_investment_token")
 @tracer.capture_method(capture_response=False)
 def create_link_token() -> Dict[str, str]:
+    # Plaid models are imported on first use to keep API cold starts fast
+    import plaid
+    from plaid.model.country_code import CountryCode
+    from plaid.model.link_token_create_request import LinkTokenCreateRequest
+    from plaid.model.link_token_create_request_user import LinkTokenCreateRequestUser
+    from plaid.model.link_token_create_response import LinkTokenCreateResponse
+    from plaid.model.products import Products
+
     user_id: str = utils.authorize_request(router)
 
     logger.append_keys(user_id=user_id)
@@ -122,13 +117,15 @@ def create_link_token() -> Dict[str, str]:
 @router.post("/")
 @tracer.capture_method(capture_response=False)
 def exchange_token() -> Response:
+    import plaid
+    from plaid.model.item_public_token_exchange_request import ItemPublicTokenExchangeRequest
+    from plaid.model.item_public_token_exchange_response import ItemPublicTokenExchangeResponse
+
     user_id: str = utils.authorize_request(router)
 
     logger.append_keys(user_id=user_id)
     tracer.put_annotation(key="UserId", value=user_id)
 
-    # TODO: validate against METADATA_SCHEMA
-
     public_token: Union[None, str] = router.current_event.json_body.get("public_token")
     if not public_token:
         raise BadRequestError("Public token not found in request")
@@ -137,6 +134,13 @@ def exchange_token() -> Response:
     if not metadata:
         raise BadRequestError("Metadata not found in request")
 
+    try:
+        schemas.validate(event=metadata, schema=schemas.METADATA_SCHEMA)
+    except SchemaValidationError as error:
+        logger.warn(f"Invalid metadata: {error.validation_message}")
+        metrics.add_metric(name="ValidationFailed", unit=MetricUnit.Count, value=1)
+        raise BadRequestError("Invalid metadata in request")
+
     institution = metadata.get("institution", {})
     institution_id = institution.get("institution_id")
     if not institution_id:
@@ -160,18 +164,6 @@ def exchange_token() -> Response:
 
     now = utils.now_iso8601()
 
-    aws_kms_cmp = AwsKmsCryptographicMaterialsProvider(key_id=KEY_ARN)
-    actions = AttributeActions(
-        default_action=CryptoAction.DO_NOTHING,
-        attribute_actions={"access_token": CryptoAction.ENCRYPT_AND_SIGN},
-    )
-    encrypted_client = EncryptedClient(
-        client=dynamodb.meta.client,
-        materials_provider=aws_kms_cmp,
-        attribute_actions=actions,
-        expect_standard_dictionaries=True,
-    )
-
     item = {
         "pk": f"USER#{user_id}#ITEM#{item_id}",
         "sk": "v0",
@@ -182,16 +174,9 @@ def exchange_token() -> Response:
         "created_at": now,
     }
 
-    def mock_write_method(**kwargs):
-        return kwargs.get("Item")
+    from app import encryption
 
-    encrypt_item = partial(
-        encrypt_put_item,
-        encrypted_client._encrypt_item,
-        encrypted_client._item_crypto_config,
-        mock_write_method,
-    )
-    encrypted_item = encrypt_item(TableName=TABLE_NAME, Item=item)
+    encrypted_item = encryption.encrypt_item(item, table_name=TABLE_NAME)
 
     items = [
         {
@@ -249,6 +234,8 @@ def exchange_token() -> Response:
         metrics.add_metric(name="AddItemFailed", unit=MetricUnit.Count, value=1)
         raise
 
+    datastore.remember_item_user(item_id, user_id)
+
     table: Table = dynamodb.Table(TABLE_NAME)
 
     with table.batch_writer(overwrite_by_pkeys=["pk", "sk"]) as batch:
@@ -277,6 +264,13 @@ def exchange_token() -> Response:
 @router.post("/get_transfer_token")
 @tracer.capture_method(capture_response=False)
 def create_transfer_token() -> Dict[str, str]:
+    from plaid.model.ach_class import ACHClass
+    from plaid.model.transfer_intent_create_mode import TransferIntentCreateMode
+    from plaid.model.transfer_intent_create_network import TransferIntentCreateNetwork
+    from plaid.model.transfer_intent_create_request import TransferIntentCreateRequest
+    from plaid.model.transfer_metadata import TransferMetadata
+    from plaid.model.transfer_user_in_request import TransferUserInRequest
+
     logger.info("Getting transfer token")
     user_id: str = utils.authorize_request(router)
     account_id: Union[None, str] = router.current_event.json_body.get("account_id")
@@ -382,6 +376,12 @@ def create_transfer_token() -> Dict[str, str]:
     return {"link_token": link_token}
 
 def create_link_token_for_transfer_ui(transfer_intent_id, client_name, access_token):
+    import plaid
+    from plaid.model.country_code import CountryCode
+    from plaid.model.link_token_create_request import LinkTokenCreateRequest
+    from plaid.model.link_token_create_request_user import LinkTokenCreateRequestUser
+    from plaid.model.products import Products
+
     client = utils.get_plaid_client()
     user_id: str = utils.authorize_request(router)
     link_token_create_object = LinkTokenCreateRequest(
@@ -5,7 +5,7 @@ import hashlib
 import hmac
 import os
 import time
-from typing import Dict, Any
+from typing import Dict, Any, Union
 import uuid
 
 from aws_lambda_powertools import Logger, Tracer, Metrics
@@ -14,15 +14,12 @@ from aws_lambda_powertools.event_handler.api_gateway import Router, Response
 from aws_lambda_powertools.event_handler import content_types
 from aws_lambda_powertools.event_handler.exceptions import BadRequestError
 from aws_lambda_powertools.utilities import parameters
-from aws_lambda_powertools.utilities.validation import validate
 from aws_lambda_powertools.utilities.validation.exceptions import SchemaValidationError
 import boto3
 import botocore
-from jose import jwt
-import requests
 from mypy_boto3_sqs.client import SQSClient
 
-from app import constants, schemas
+from app import constants, datastore, schemas, webhook_keys
 
 __all__ = ["router"]
 
@@ -34,10 +31,6 @@ logger = Logger(child=True)
 metrics = Metrics()
 router = Router()
 
-
-# Cache for webhook validation keys.
-KEY_CACHE = {}
-
 # Plaid client credentials
 CREDENTIALS = {}
 
@@ -65,44 +58,20 @@ def get_credentials() -> Dict[str, str]:
 
 
 def verify(body: str, signed_jwt: str) -> bool:
+    # jose is only needed to verify webhooks
+    from jose import jwt
+
     current_key_id = jwt.get_unverified_header(signed_jwt)["kid"]
 
-    credentials = get_credentials()
-
-    # If the key is not in the cache, update all non-expired keys.
-    if current_key_id not in KEY_CACHE:
-        keys_ids_to_update = [
-            key_id for key_id, key in KEY_CACHE.items() if key["expired_at"] is None
-        ]
-        keys_ids_to_update.append(current_key_id)
-
-        for key_id in keys_ids_to_update:
-            r = requests.post(
-                credentials["endpoint"] + "/webhook_verification_key/get",
-                json={
-                    "client_id": credentials["client_id"],
-                    "secret": credentials["client_secret"],
-                    "key_id": key_id,
-                },
-            )
-
-            # If this is the case, the key ID may be invalid.
-            if r.status_code != 200:
-                logger.debug(f"Key response: {r}")
-                continue
-
-            response = r.json()
-            key = response["key"]
-            KEY_CACHE[key_id] = key
-
-    # If the key ID is not in the cache, the key ID may be invalid.
-    if current_key_id not in KEY_CACHE:
+    verifier = webhook_keys.get_verifier(current_key_id, get_credentials())
+
+    # If there is no key, the key ID may be invalid.
+    if verifier is None:
         metrics.add_metric(name="JWTKeyInvalid", unit=MetricUnit.Count, value=1)
         logger.warn(f"Key {current_key_id} is invalid")
         return False
 
-    # Fetch the current key from the cache.
-    key = KEY_CACHE[current_key_id]
+    key, public_key = verifier
 
     # Reject expired keys.
     if key["expired_at"] is not None:
@@ -110,26 +79,43 @@ def verify(body: str, signed_jwt: str) -> bool:
         logger.warn(f"Key {current_key_id} has expired")
         return False
 
-    # Validate the signature and extract the claims.
+    # Compute the hash of the body.
+    body_hash = hashlib.sha256(body.encode()).hexdigest()
+
+    # Check the cheap claims before the signature, the signature check below still
+    # covers them so a forged token gains nothing from passing these.
     try:
-        claims = jwt.decode(signed_jwt, key, algorithms=["ES256"])
+        unverified_claims = jwt.get_unverified_claims(signed_jwt)
     except jwt.JWTError:
         metrics.add_metric(name="JWTDecodeError", unit=MetricUnit.Count, value=1)
         logger.warn(f"Failed to decode JWT: {signed_jwt}")
         return False
 
-    # Ensure that the token is not expired.
-    if claims["iat"] < time.time() - constants.TOKEN_EXPIRATION:
+    # The claims are not verified yet, so reject an issued at time that is not a number
+    # rather than let the comparison raise.
+    issued_at = unverified_claims.get("iat")
+    if (
+        not isinstance(issued_at, (int, float))
+        or issued_at < time.time() - constants.TOKEN_EXPIRATION
+    ):
         metrics.add_metric(name="JWTKeyExpired", unit=MetricUnit.Count, value=1)
         logger.warn(f"Key {current_key_id} has expired")
         return False
 
-    # Compute the hash of the body.
-    m = hashlib.sha256()
-    m.update(body.encode())
-    body_hash = m.hexdigest()
+    if not hmac.compare_digest(body_hash, str(unverified_claims.get("request_body_sha256", ""))):
+        metrics.add_metric(name="JWTBodyHashMismatch", unit=MetricUnit.Count, value=1)
+        logger.warn("Webhook body does not match the signed hash")
+        return False
 
-    # Ensure that the hash of the body matches the claim.
+    # Validate the signature and extract the claims.
+    try:
+        claims = jwt.decode(signed_jwt, public_key, algorithms=["ES256"])
+    except jwt.JWTError:
+        metrics.add_metric(name="JWTDecodeError", unit=MetricUnit.Count, value=1)
+        logger.warn(f"Failed to decode JWT: {signed_jwt}")
+        return False
+
+    # Ensure that the hash of the body matches the verified claim.
     # Use constant time comparison to prevent timing attacks.
     return hmac.compare_digest(body_hash, claims["request_body_sha256"])
 
@@ -153,7 +139,7 @@ def post_webhook() -> Response:
         raise BadRequestError("Failed to verify request from Plaid")
 
     try:
-        validate(event=json_body, schema=schemas.WEBHOOK_SCHEMA)
+        schemas.validate(event=json_body, schema=schemas.WEBHOOK_SCHEMA)
     except SchemaValidationError:
         logger.exception(f"Failed to validate webhook payload: {json_body}")
         metrics.add_metric(name="ValidationFailed", unit=MetricUnit.Count, value=1)
@@ -188,6 +174,14 @@ def post_webhook() -> Response:
         "MessageGroupId": item_id,
     }
 
+    # saves the webhook processor looking up the owner of the item
+    user_id: Union[str, None] = datastore.get_cached_user_by_item(item_id)
+    if user_id:
+        params["MessageAttributes"]["UserId"] = {
+            "DataType": "String",
+            "StringValue": user_id,
+        }
+
     metrics.add_metric(name="SendCount", unit=MetricUnit.Count, value=1)
     logger.debug(f"Sending message to SQS: {params}")
 
@@ -224,7 +218,7 @@ def post_webhook() -> Response:
         raise BadRequestError("Failed to verify request from Plaid")
 
     try:
-        validate(event=json_body, schema=schemas.WEBHOOK_SCHEMA)
+        schemas.validate(event=json_body, schema=schemas.WEBHOOK_TRANSFER_SCHEMA)
     except SchemaValidationError:
         logger.exception(f"Failed to validate webhook payload: {json_body}")
         metrics.add_metric(name="ValidationFailed", unit=MetricUnit.Count, value=1)
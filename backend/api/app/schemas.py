@@ -1,6 +1,19 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import threading
+from typing import Any, Callable, Dict
+
+from aws_lambda_powertools.utilities.validation.exceptions import SchemaValidationError
+
+__all__ = [
+    "WEBHOOK_SCHEMA",
+    "WEBHOOK_TRANSFER_SCHEMA",
+    "METADATA_SCHEMA",
+    "get_validator",
+    "validate",
+]
+
 WEBHOOK_SCHEMA = {
     "$schema": "http://json-schema.org/draft-07/schema",
     "type": "object",
@@ -38,3 +51,51 @@ METADATA_SCHEMA = {
     },
     "required": ["institution"],
 }
+
+# Compiled validators, keyed by the id() of the module level schema they were built from
+_validators: Dict[int, Callable[[Any], Any]] = {}
+_validators_lock = threading.Lock()
+
+
+def get_validator(schema: Dict[str, Any]) -> Callable[[Any], Any]:
+    """
+    Return a validator for one of the schemas above, compiling it on first use
+    """
+    validator = _validators.get(id(schema))
+    if validator is not None:
+        return validator
+
+    # fastjsonschema ships with powertools, it is only imported once a schema is used
+    import fastjsonschema
+
+    with _validators_lock:
+        validator = _validators.get(id(schema))
+        if validator is None:
+            validator = fastjsonschema.compile(schema)
+            _validators[id(schema)] = validator
+
+    return validator
+
+
+def validate(event: Any, schema: Dict[str, Any]) -> None:
+    """
+    Validate an event against a schema using its compiled validator
+
+    Raises the same SchemaValidationError as powertools' validate().
+    """
+    import fastjsonschema
+
+    try:
+        get_validator(schema)(event)
+    except fastjsonschema.JsonSchemaValueException as e:
+        message = f"Failed schema validation. Error: {e.message}, Path: {e.path}, Data: {e.value}"
+        raise SchemaValidationError(
+            message,
+            validation_message=e.message,
+            name=e.name,
+            path=e.path,
+            value=e.value,
+            definition=e.definition,
+            rule=e.rule,
+            rule_definition=e.rule_definition,
+        )
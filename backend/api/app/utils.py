@@ -2,11 +2,14 @@
 # -*- coding: utf-8 -*-
 
 import base64
+from collections import OrderedDict
 import datetime
 import decimal
 import json
 import os
-from typing import Any
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Dict, Hashable, Union
 import uuid
 
 from aws_lambda_powertools import Logger, Metrics
@@ -17,15 +20,16 @@ from aws_lambda_powertools.utilities.data_classes.api_gateway_proxy_event import
 )
 from aws_lambda_powertools.event_handler.exceptions import UnauthorizedError
 from aws_lambda_powertools.utilities import parameters
-import plaid
-from plaid.api import plaid_api
-from plaid.model.transfer_user_in_request import TransferUserInRequest
-from plaid.model.transfer_intent_create_request import TransferIntentCreateRequest
-from plaid.model.transfer_capabilities_get_request import TransferCapabilitiesGetRequest
 
 from .constants import BOTO3_CONFIG
 
+if TYPE_CHECKING:
+    # plaid_api imports every Plaid model, so it is only loaded on first use
+    from plaid.api import plaid_api
+    from plaid.model.transfer_intent_create_request import TransferIntentCreateRequest
+
 __all__ = [
+    "LRUCache",
     "get_plaid_client",
     "now_iso8601",
     "authorize_request",
@@ -36,32 +40,126 @@ __all__ = [
 ]
 
 PLAID_SECRET_ARN = os.getenv("PLAID_SECRET_ARN")
+# How long (in seconds) the Plaid credentials are used before being re-fetched
+PLAID_SECRET_MAX_AGE = float(os.getenv("PLAID_SECRET_MAX_AGE", "900"))
+# How long (in seconds) to keep the current credentials after a failed re-fetch
+PLAID_SECRET_RETRY_INTERVAL = float(os.getenv("PLAID_SECRET_RETRY_INTERVAL", "30"))
+# Maximum connections kept open in the pool shared by every Plaid API call
+PLAID_CONNECTION_POOL_SIZE = int(os.getenv("PLAID_CONNECTION_POOL_SIZE", "16"))
 
 logger = Logger(child=True)
 metrics = Metrics()
 secrets_provider = parameters.SecretsProvider(config=BOTO3_CONFIG)
 
+# Sentinel for cache lookups, since None can be a cached value
+_MISSING = object()
 
-def get_plaid_client() -> plaid_api.PlaidApi:
-    try:
-        credentials = secrets_provider.get(PLAID_SECRET_ARN, transform="json")
-        metrics.add_metric(name="FetchSecretSuccess", unit=MetricUnit.Count, value=1)
-    except Exception:
-        logger.exception(f"Unable to get secret value from {PLAID_SECRET_ARN}")
-        metrics.add_metric(name="FetchSecretFailed", unit=MetricUnit.Count, value=1)
-        raise
-
-    configuration = plaid.Configuration(
-        host=credentials["endpoint"],
-        api_key={
-            "clientId": credentials["client_id"],
-            "secret": credentials["client_secret"],
-        },
-    )
-    api_client = plaid.ApiClient(configuration)
-    client = plaid_api.PlaidApi(api_client)
+_plaid_client_lock = threading.Lock()
+_plaid_client: "Union[plaid_api.PlaidApi, None]" = None
+_plaid_credentials: Union[Dict[str, str], None] = None
+_plaid_credentials_fetched_at = 0.0
+
+
+class LRUCache:
+    """
+    Thread-safe least recently used cache whose entries expire after a TTL (in seconds)
+    """
+
+    def __init__(self, max_size: int = 128, ttl: float = 60) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return default
+
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Union[float, None] = None) -> None:
+        if ttl is None:
+            ttl = self.ttl
 
-    return client
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def get_plaid_client() -> "plaid_api.PlaidApi":
+    """
+    Return the process-wide Plaid client, building it on first use
+
+    The credentials are re-fetched once they are older than PLAID_SECRET_MAX_AGE
+    and the client (with its connection pool) is only rebuilt if they changed. A
+    failed re-fetch is retried after PLAID_SECRET_RETRY_INTERVAL.
+    """
+    global _plaid_client, _plaid_credentials, _plaid_credentials_fetched_at
+
+    with _plaid_client_lock:
+        age = time.monotonic() - _plaid_credentials_fetched_at
+        if _plaid_client is not None and age < PLAID_SECRET_MAX_AGE:
+            return _plaid_client
+
+        try:
+            credentials = secrets_provider.get(PLAID_SECRET_ARN, transform="json", force_fetch=True)
+            metrics.add_metric(name="FetchSecretSuccess", unit=MetricUnit.Count, value=1)
+        except Exception:
+            logger.exception(f"Unable to get secret value from {PLAID_SECRET_ARN}")
+            metrics.add_metric(name="FetchSecretFailed", unit=MetricUnit.Count, value=1)
+            if _plaid_client is None:
+                raise
+            # keep using the existing client, and back off before trying to refresh again
+            _plaid_credentials_fetched_at = (
+                time.monotonic() - PLAID_SECRET_MAX_AGE + PLAID_SECRET_RETRY_INTERVAL
+            )
+            return _plaid_client
+
+        _plaid_credentials_fetched_at = time.monotonic()
+
+        if _plaid_client is None or credentials != _plaid_credentials:
+            import plaid
+            from plaid.api import plaid_api
+
+            configuration = plaid.Configuration(
+                host=credentials["endpoint"],
+                api_key={
+                    "clientId": credentials["client_id"],
+                    "secret": credentials["client_secret"],
+                },
+            )
+            configuration.connection_pool_maxsize = PLAID_CONNECTION_POOL_SIZE
+            api_client = plaid.ApiClient(configuration)
+
+            _plaid_client = plaid_api.PlaidApi(api_client)
+            _plaid_credentials = credentials
+
+        return _plaid_client
 
 
 def now_iso8601() -> str:
@@ -136,6 +234,9 @@ def generate_id() -> str:
 
 
 def get_is_rtp_capable(account_id, access_token):
+    import plaid
+    from plaid.model.transfer_capabilities_get_request import TransferCapabilitiesGetRequest
+
     try:
         # Creating the transfer intent using the Plaid client
         request = TransferCapabilitiesGetRequest(access_token, account_id)
@@ -148,7 +249,9 @@ def get_is_rtp_capable(account_id, access_token):
         print(f"An error occurred: {e}")
         return None
     
-def get_transfer_intent_id(transerIntentRequest: TransferIntentCreateRequest):
+def get_transfer_intent_id(transerIntentRequest: "TransferIntentCreateRequest"):
+    import plaid
+
     try:
         response = get_plaid_client().transfer_intent_create(transerIntentRequest)
         print(response.to_dict())
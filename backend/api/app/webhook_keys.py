@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from concurrent.futures import ThreadPoolExecutor
+import os
+import threading
+from typing import Any, Dict, List, Set, Tuple, Union
+
+from aws_lambda_powertools import Logger, Metrics
+from aws_lambda_powertools.metrics import MetricUnit
+import botocore
+
+from app import datastore, utils
+
+__all__ = ["get_key", "get_verifier"]
+
+# How long (in seconds) verification keys are kept in memory and in DynamoDB
+WEBHOOK_KEY_CACHE_TTL = float(os.getenv("WEBHOOK_KEY_CACHE_TTL", "3600"))
+WEBHOOK_KEY_TTL = int(os.getenv("WEBHOOK_KEY_TTL", "86400"))
+# How long (in seconds) key IDs that Plaid reports as invalid are remembered in memory
+WEBHOOK_KEY_NEGATIVE_TTL = int(os.getenv("WEBHOOK_KEY_NEGATIVE_TTL", "60"))
+# Timeout (in seconds) for /webhook_verification_key/get
+WEBHOOK_KEY_FETCH_TIMEOUT = float(os.getenv("WEBHOOK_KEY_FETCH_TIMEOUT", "5"))
+
+logger = Logger(child=True)
+metrics = Metrics()
+
+key_cache = utils.LRUCache(max_size=64, ttl=WEBHOOK_KEY_CACHE_TTL)
+# Public key objects constructed from the JWKs above, keyed by key ID
+verifier_cache = utils.LRUCache(max_size=64, ttl=WEBHOOK_KEY_CACHE_TTL)
+
+# Key IDs known to be active, refreshed whenever a new key ID is fetched
+_active_key_ids: Set[str] = set()
+_active_key_ids_lock = threading.Lock()
+
+# Plaid error code for a key ID that does not exist
+INVALID_KEY_ID_ERROR_CODE = "INVALID_WEBHOOK_VERIFICATION_KEY_ID"
+
+# Distinguishes a cached invalid key ID (None) from a key ID missing from the cache
+_NOT_CACHED = object()
+
+
+def _fetch_key(
+    key_id: str, credentials: Dict[str, str]
+) -> Tuple[bool, Union[Dict[str, Any], None]]:
+    """
+    Fetch a key from Plaid, returning whether Plaid answered and the key if it exists
+    """
+    # requests is only needed to verify webhooks
+    import requests
+
+    try:
+        r = requests.post(
+            credentials["endpoint"] + "/webhook_verification_key/get",
+            json={
+                "client_id": credentials["client_id"],
+                "secret": credentials["client_secret"],
+                "key_id": key_id,
+            },
+            timeout=WEBHOOK_KEY_FETCH_TIMEOUT,
+        )
+    except requests.RequestException:
+        logger.exception(f"Unable to fetch webhook key {key_id}")
+        return False, None
+
+    if r.status_code != 200:
+        try:
+            error_code = r.json().get("error_code")
+        except ValueError:
+            error_code = None
+
+        # only an unknown key ID is worth remembering, rate limits and
+        # credential errors must not cause valid webhooks to be rejected
+        if error_code == INVALID_KEY_ID_ERROR_CODE:
+            logger.debug(f"Key response: {r}")
+            return True, None
+
+        logger.warn(f"Unexpected key response: {r} ({error_code})")
+        return False, None
+
+    return True, r.json()["key"]
+
+
+def _store_key(key_id: str, key: Union[Dict[str, Any], None]) -> None:
+    if key is None:
+        # invalid key IDs are only remembered by this container, so a forged
+        # header cannot make the API write to DynamoDB
+        metrics.add_metric(name="WebhookKeyInvalid", unit=MetricUnit.Count, value=1)
+        key_cache.set(key_id, None, ttl=WEBHOOK_KEY_NEGATIVE_TTL)
+        with _active_key_ids_lock:
+            _active_key_ids.discard(key_id)
+        return
+
+    key_cache.set(key_id, key)
+
+    with _active_key_ids_lock:
+        if key.get("expired_at") is None:
+            _active_key_ids.add(key_id)
+        else:
+            _active_key_ids.discard(key_id)
+
+    try:
+        datastore.put_webhook_key(key_id, key, WEBHOOK_KEY_TTL)
+    except botocore.exceptions.ClientError:
+        # the key is still cached in memory, the next container will fetch it again
+        metrics.add_metric(name="WebhookKeyStoreFailed", unit=MetricUnit.Count, value=1)
+
+
+def _refresh_keys(key_id: str, credentials: Dict[str, str]) -> None:
+    """
+    Fetch a new key ID along with every other active key ID, in parallel
+
+    Refreshing the active keys is how we learn that Plaid has expired one of them.
+    """
+    with _active_key_ids_lock:
+        key_ids: List[str] = [key_id] + [k for k in _active_key_ids if k != key_id]
+
+    metrics.add_metric(name="WebhookKeyFetch", unit=MetricUnit.Count, value=len(key_ids))
+
+    with ThreadPoolExecutor(max_workers=len(key_ids)) as executor:
+        results = list(executor.map(lambda k: _fetch_key(k, credentials), key_ids))
+
+    for fetched_key_id, (answered, key) in zip(key_ids, results):
+        if answered:
+            _store_key(fetched_key_id, key)
+
+
+def get_key(key_id: str, credentials: Dict[str, str]) -> Union[Dict[str, Any], None]:
+    """
+    Return the webhook verification key for a key ID, or None if it is invalid
+
+    Keys are looked up in memory, then in DynamoDB (shared by every container) and
+    only then fetched from Plaid. Invalid key IDs are remembered in memory for a
+    short time so forged headers do not trigger calls to Plaid.
+    """
+    cached = key_cache.get(key_id, _NOT_CACHED)
+    if cached is not _NOT_CACHED:
+        metrics.add_metric(name="WebhookKeyCacheHit", unit=MetricUnit.Count, value=1)
+        return cached
+
+    metrics.add_metric(name="WebhookKeyCacheMiss", unit=MetricUnit.Count, value=1)
+
+    try:
+        stored = datastore.get_webhook_key(key_id)
+    except botocore.exceptions.ClientError:
+        stored = None
+
+    if stored is not None:
+        key: Dict[str, Any] = stored["key"]
+        key_cache.set(key_id, key)
+        if key.get("expired_at") is None:
+            with _active_key_ids_lock:
+                _active_key_ids.add(key_id)
+        return key
+
+    _refresh_keys(key_id, credentials)
+
+    return key_cache.get(key_id)
+
+
+def get_verifier(
+    key_id: str, credentials: Dict[str, str]
+) -> Union[Tuple[Dict[str, Any], Any], None]:
+    """
+    Return the key for a key ID along with its constructed public key, or None if invalid
+
+    Building the EC public key from the JWK is the costly part of preparing to
+    verify, so the constructed key is reused for as long as the JWK is unchanged.
+    """
+    key = get_key(key_id, credentials)
+    if key is None:
+        return None
+
+    cached: Union[Tuple[Dict[str, Any], Any], None] = verifier_cache.get(key_id)
+    if cached is not None and cached[0] == key:
+        return cached
+
+    # jose is only needed to verify webhooks
+    from jose import jwk
+
+    metrics.add_metric(name="WebhookVerifierConstructed", unit=MetricUnit.Count, value=1)
+    verifier = (key, jwk.construct(key, algorithm="ES256"))
+    verifier_cache.set(key_id, verifier)
+    return verifier
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import hashlib
+import json
+import os
+import random
+import time
+from typing import Any, Dict, List, Tuple
+
+from aws_lambda_powertools import Logger, Metrics
+from aws_lambda_powertools.metrics import MetricUnit
+from botocore.exceptions import ClientError
+from mypy_boto3_dynamodb import DynamoDBClient
+
+from app import constants
+
+__all__ = ["CONTENT_HASH_ATTRIBUTE_NAME", "filter_unchanged"]
+
+# Comma separated sort key prefixes of items to skip writing when unchanged
+CHANGE_DETECTION_PREFIXES = tuple(
+    prefix.strip()
+    for prefix in os.getenv(
+        "CHANGE_DETECTION_PREFIXES", "ACCOUNT#,SECURITY#,CREDITCARD#,MORTGAGE#,STUDENTLOAN#"
+    ).split(",")
+    if prefix.strip()
+)
+
+CONTENT_HASH_ATTRIBUTE_NAME = "content_hash"
+
+# Attributes that change on every write without the content changing
+EXCLUDED_ATTRIBUTE_NAMES = frozenset([CONTENT_HASH_ATTRIBUTE_NAME, "updated_at"])
+
+logger = Logger(child=True)
+metrics = Metrics()
+
+
+def content_hash(item: Dict[str, Any]) -> str:
+    """
+    Return a digest of an item's content, ignoring volatile attributes
+    """
+    content = {key: value for key, value in item.items() if key not in EXCLUDED_ATTRIBUTE_NAMES}
+    encoded = json.dumps(content, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def _get_hashes(
+    client: DynamoDBClient, table_name: str, keys: List[Dict[str, str]]
+) -> Dict[Tuple[str, str], str]:
+    """
+    Return the stored content hash for each of the given keys that has one
+    """
+    hashes: Dict[Tuple[str, str], str] = {}
+    size = constants.DYNAMODB_BATCH_GET_ITEM_MAX
+
+    for i in range(0, len(keys), size):
+        pending: Dict[str, Any] = {
+            table_name: {
+                "Keys": keys[i : i + size],
+                "ProjectionExpression": "#pk, #sk, #hash",
+                "ExpressionAttributeNames": {
+                    "#pk": "pk",
+                    "#sk": "sk",
+                    "#hash": CONTENT_HASH_ATTRIBUTE_NAME,
+                },
+            }
+        }
+
+        for attempt in range(constants.DYNAMODB_BATCH_WRITE_MAX_ATTEMPTS):
+            response = client.batch_get_item(RequestItems=pending)
+
+            for item in response.get("Responses", {}).get(table_name, []):
+                if CONTENT_HASH_ATTRIBUTE_NAME in item:
+                    hashes[(item["pk"], item["sk"])] = item[CONTENT_HASH_ATTRIBUTE_NAME]
+
+            pending = response.get("UnprocessedKeys", {})
+            if not pending:
+                break
+
+            delay = min(
+                constants.DYNAMODB_BATCH_WRITE_RETRY_MAX_DELAY,
+                constants.DYNAMODB_BATCH_WRITE_RETRY_BASE_DELAY * 2**attempt,
+            )
+            time.sleep(random.uniform(delay / 2, delay))
+
+        # keys we could not read are treated as changed and written anyway
+
+    return hashes
+
+
+def filter_unchanged(
+    client: DynamoDBClient, table_name: str, requests: List[Dict[str, Any]]
+) -> List[Dict[str, Any]]:
+    """
+    Drop put requests whose content matches what is already stored
+
+    Items under CHANGE_DETECTION_PREFIXES are stamped with a content hash, which is
+    compared against the stored hash before writing. Requests must already be
+    unique by primary key.
+    """
+    if not CHANGE_DETECTION_PREFIXES:
+        return requests
+
+    candidates: Dict[Tuple[str, str], str] = {}
+    for request in requests:
+        item = request.get("PutRequest", {}).get("Item")
+        if item is None or not item["sk"].startswith(CHANGE_DETECTION_PREFIXES):
+            continue
+        digest = content_hash(item)
+        item[CONTENT_HASH_ATTRIBUTE_NAME] = digest
+        candidates[(item["pk"], item["sk"])] = digest
+
+    if not candidates:
+        return requests
+
+    keys = [{"pk": pk, "sk": sk} for pk, sk in candidates]
+    try:
+        stored = _get_hashes(client, table_name, keys)
+    except ClientError:
+        logger.exception("Unable to read content hashes, writing all items")
+        metrics.add_metric(name="ContentHashReadFailed", unit=MetricUnit.Count, value=1)
+        return requests
+
+    unchanged = {key for key, digest in candidates.items() if stored.get(key) == digest}
+
+    metrics.add_metric(name="UnchangedItemSkipped", unit=MetricUnit.Count, value=len(unchanged))
+    metrics.add_metric(
+        name="ChangedItemWritten", unit=MetricUnit.Count, value=len(candidates) - len(unchanged)
+    )
+
+    if not unchanged:
+        return requests
+
+    logger.debug(f"Skipping {len(unchanged)} of {len(candidates)} unchanged items")
+
+    return [
+        request
+        for request in requests
+        if "PutRequest" not in request
+        or (request["PutRequest"]["Item"]["pk"], request["PutRequest"]["Item"]["sk"])
+        not in unchanged
+    ]
@@ -5,6 +5,13 @@ from botocore.config import Config
 
 __all__ = [
     "BOTO3_CONFIG",
+    "DYNAMODB_BATCH_GET_ITEM_MAX",
+    "DYNAMODB_BATCH_WRITE_ITEM_MAX",
+    "DYNAMODB_BATCH_WRITE_MAX_ATTEMPTS",
+    "DYNAMODB_BATCH_WRITE_RETRY_BASE_DELAY",
+    "DYNAMODB_BATCH_WRITE_RETRY_MAX_DELAY",
+    "SQS_CONTENT_ENCODING_ATTRIBUTE_NAME",
+    "SQS_CONTENT_ENCODING_ZLIB",
 ]
 
 BOTO3_CONFIG = Config(
@@ -13,3 +20,20 @@ BOTO3_CONFIG = Config(
         "mode": "standard",
     }
 )
+
+# Message attribute describing how the message body is encoded
+SQS_CONTENT_ENCODING_ATTRIBUTE_NAME = "ContentEncoding"
+SQS_CONTENT_ENCODING_ZLIB = "zlib"
+
+# Maximum number of keys in a single BatchGetItem call
+DYNAMODB_BATCH_GET_ITEM_MAX = 100
+
+# Maximum number of put or delete requests in a single BatchWriteItem call
+DYNAMODB_BATCH_WRITE_ITEM_MAX = 25
+
+# Attempts made to write items that DynamoDB returns as UnprocessedItems
+DYNAMODB_BATCH_WRITE_MAX_ATTEMPTS = 8
+
+# Base and maximum delay (in seconds) for the backoff between unprocessed item retries
+DYNAMODB_BATCH_WRITE_RETRY_BASE_DELAY = 0.05
+DYNAMODB_BATCH_WRITE_RETRY_MAX_DELAY = 2.0
@@ -1,7 +1,6 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-import json
 import os
 from typing import Dict, Any, List, Union
 
@@ -9,10 +8,9 @@ from aws_lambda_powertools import Logger, Tracer, Metrics
 from aws_lambda_powertools.metrics import MetricUnit
 from aws_lambda_powertools.utilities.typing import LambdaContext
 import boto3
-from mypy_boto3_dynamodb import DynamoDBServiceResource
-from mypy_boto3_dynamodb.service_resource import Table
+from mypy_boto3_dynamodb import DynamoDBServiceResource, DynamoDBClient
 
-from app import constants, utils
+from app import constants, utils, writer
 
 TABLE_NAME = os.getenv("TABLE_NAME")
 ENVIRONMENT = os.getenv("ENVIRONMENT", "dev")
@@ -23,7 +21,8 @@ metrics = Metrics()
 metrics.set_default_dimensions(environment=ENVIRONMENT)
 
 dynamodb: DynamoDBServiceResource = boto3.resource("dynamodb", config=constants.BOTO3_CONFIG)
-table: Table = dynamodb.Table(TABLE_NAME)
+# the resource's client serializes native Python types like Table.batch_writer does
+dynamodb_client: DynamoDBClient = dynamodb.meta.client
 
 
 @metrics.log_metrics(capture_cold_start_metric=False)
@@ -42,24 +41,26 @@ def handler(event: Dict[str, Any], context: LambdaContext) -> Dict[str, Any]:
     delete_count = 0
     put_count = 0
 
-    with table.batch_writer(overwrite_by_pkeys=["pk", "sk"]) as batch:
-        for record in records:
-            item: Dict[str, Any] = json.loads(record["body"])
-            event_name: Union[str, None] = (
-                record.get("messageAttributes", {}).get("EventName", {}).get("stringValue")
-            )
-
-            if event_name == "DELETE":
-                key = {
-                    "pk": item["pk"],
-                    "sk": item["sk"],
-                }
-                batch.delete_item(Key=key)
-                delete_count += 1
-            else:
-                item = utils.floats_to_decimal(item)
-                batch.put_item(Item=item)
-                put_count += 1
+    requests: List[Dict[str, Any]] = []
+
+    for record in records:
+        item: Dict[str, Any] = utils.load_item(record)
+        event_name: Union[str, None] = (
+            record.get("messageAttributes", {}).get("EventName", {}).get("stringValue")
+        )
+
+        if event_name == "DELETE":
+            key = {
+                "pk": item["pk"],
+                "sk": item["sk"],
+            }
+            requests.append({"DeleteRequest": {"Key": key}})
+            delete_count += 1
+        else:
+            requests.append({"PutRequest": {"Item": item}})
+            put_count += 1
+
+    writer.write_requests(dynamodb_client, TABLE_NAME, requests)
 
     metrics.add_metric(name="PutItemCount", unit=MetricUnit.Count, value=put_count)
     metrics.add_metric(name="DeleteItemCount", unit=MetricUnit.Count, value=delete_count)
@@ -1,21 +1,39 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import base64
+import json
 from decimal import Decimal
-from typing import Any
+from typing import Any, Dict
+import zlib
 
-__all__ = ["floats_to_decimal"]
+from app import constants
 
+__all__ = ["decode_body", "load_item"]
 
-def floats_to_decimal(obj: Any) -> Any:
+
+def decode_body(record: Dict[str, Any]) -> str:
+    """
+    Return the message body of an SQS record, decompressing it if needed
+    """
+    body: str = record["body"]
+    encoding = (
+        record.get("messageAttributes", {})
+        .get(constants.SQS_CONTENT_ENCODING_ATTRIBUTE_NAME, {})
+        .get("stringValue")
+    )
+
+    if encoding == constants.SQS_CONTENT_ENCODING_ZLIB:
+        return zlib.decompress(base64.b64decode(body)).decode("utf-8")
+
+    return body
+
+
+def load_item(record: Dict[str, Any]) -> Dict[str, Any]:
     """
-    Convert floats to Decimal
+    Parse the message body of an SQS record into a DynamoDB item
+
+    Floats are parsed straight from their JSON literal into Decimal, so the item
+    does not need a second pass before it can be written.
     """
-    if isinstance(obj, float):
-        obj = Decimal(str(obj))
-    elif isinstance(obj, dict):
-        for key, value in obj.items():
-            obj[key] = floats_to_decimal(value)
-    elif isinstance(obj, list):
-        obj = [floats_to_decimal(value) for value in obj]
-    return obj
+    return json.loads(decode_body(record), parse_float=Decimal)
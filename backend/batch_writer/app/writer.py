@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from concurrent.futures import ThreadPoolExecutor
+import os
+import random
+import time
+from typing import Any, Dict, List, Tuple
+
+from aws_lambda_powertools import Logger, Metrics
+from aws_lambda_powertools.metrics import MetricUnit
+from mypy_boto3_dynamodb import DynamoDBClient
+
+from app import changes, constants
+
+__all__ = ["BatchWriteError", "write_requests"]
+
+# Maximum number of BatchWriteItem calls in flight at once
+WRITER_MAX_CONCURRENCY = int(os.getenv("WRITER_MAX_CONCURRENCY", "4"))
+
+logger = Logger(child=True)
+metrics = Metrics()
+
+
+class BatchWriteError(Exception):
+    pass
+
+
+def _request_key(request: Dict[str, Any]) -> Tuple[str, str]:
+    if "PutRequest" in request:
+        item = request["PutRequest"]["Item"]
+    else:
+        item = request["DeleteRequest"]["Key"]
+    return item["pk"], item["sk"]
+
+
+def _dedupe_requests(requests: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Keep only the last request for each primary key
+
+    This matches the behaviour of batch_writer(overwrite_by_pkeys=["pk", "sk"]).
+    """
+    latest: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    for request in requests:
+        key = _request_key(request)
+        latest.pop(key, None)
+        latest[key] = request
+    return list(latest.values())
+
+
+def _group_requests(requests: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+    """
+    Split unique write requests into BatchWriteItem sized flushes grouped by partition key
+    """
+    groups: Dict[str, List[Dict[str, Any]]] = {}
+    for request in requests:
+        groups.setdefault(_request_key(request)[0], []).append(request)
+
+    ordered = [request for group in groups.values() for request in group]
+    size = constants.DYNAMODB_BATCH_WRITE_ITEM_MAX
+    return [ordered[i : i + size] for i in range(0, len(ordered), size)]
+
+
+def _flush(
+    client: DynamoDBClient, table_name: str, requests: List[Dict[str, Any]]
+) -> Tuple[float, int]:
+    """
+    Write a single flush, retrying unprocessed items with backoff
+
+    Returns the latency (in seconds) and number of throttled attempts. This is
+    called from worker threads, so metrics are left to the caller.
+    """
+    started = time.perf_counter()
+    throttles = 0
+    pending = requests
+
+    for attempt in range(constants.DYNAMODB_BATCH_WRITE_MAX_ATTEMPTS):
+        response = client.batch_write_item(RequestItems={table_name: pending})
+
+        pending = response.get("UnprocessedItems", {}).get(table_name, [])
+        if not pending:
+            return time.perf_counter() - started, throttles
+
+        # the more items were left unprocessed, the further we are over capacity
+        throttles += 1
+        pressure = len(pending) / len(requests)
+        delay = min(
+            constants.DYNAMODB_BATCH_WRITE_RETRY_MAX_DELAY,
+            constants.DYNAMODB_BATCH_WRITE_RETRY_BASE_DELAY * 2**attempt * (1 + pressure),
+        )
+        logger.debug(f"{len(pending)} unprocessed items, retrying in {delay:.3f}s")
+        time.sleep(random.uniform(delay / 2, delay))
+
+    raise BatchWriteError(f"{len(pending)} items still unprocessed after retries")
+
+
+def write_requests(client: DynamoDBClient, table_name: str, requests: List[Dict[str, Any]]) -> None:
+    """
+    Write PutRequest/DeleteRequest entries to DynamoDB with concurrent flushes
+    """
+    unique = _dedupe_requests(requests)
+    changed = changes.filter_unchanged(client, table_name, unique)
+    flushes = _group_requests(changed)
+    if not flushes:
+        return
+
+    max_workers = min(WRITER_MAX_CONCURRENCY, len(flushes))
+    throttles = 0
+
+    try:
+        if max_workers <= 1:
+            results = [_flush(client, table_name, flush) for flush in flushes]
+        else:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = [executor.submit(_flush, client, table_name, flush) for flush in flushes]
+                results = [future.result() for future in futures]
+    except BatchWriteError:
+        metrics.add_metric(name="BatchWriteFailed", unit=MetricUnit.Count, value=1)
+        raise
+
+    for latency, flush_throttles in results:
+        throttles += flush_throttles
+        metrics.add_metric(
+            name="BatchWriteLatency", unit=MetricUnit.Milliseconds, value=latency * 1000
+        )
+
+    metrics.add_metric(name="BatchWriteFlushCount", unit=MetricUnit.Count, value=len(flushes))
+    metrics.add_metric(name="BatchWriteThrottleCount", unit=MetricUnit.Count, value=throttles)
+
+    logger.debug(
+        f"Wrote {len(changed)} of {len(requests)} requests in {len(flushes)} flushes using {max_workers} workers ({throttles} throttled)"
+    )
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark of the per-request encryption overhead of link-token exchange
+
+Compares the clients exchange_token used to build on every request (a KMS
+materials provider, attribute actions and an EncryptedClient) with the shared
+encryption service in app.encryption. Encryption itself runs against a local
+wrapped-key provider and pre-loaded table info so the benchmark needs no AWS
+access. On top of these numbers, every request used to pay a DescribeTable call
+for its fresh EncryptedClient, and every KMS call avoided by the materials cache
+is another network round trip.
+
+Usage (with the backend/requirements-dev.txt and backend/api packages installed):
+
+    python backend/benchmarks/api_encrypt_item.py [--number 2000]
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import timeit
+from typing import Any, Callable, Dict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "api"))
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.setdefault("KEY_ARN", "arn:aws:kms:us-east-1:111122223333:key/benchmark")
+os.environ.setdefault("TABLE_NAME", "benchmark")
+os.environ.setdefault("POWERTOOLS_METRICS_NAMESPACE", "benchmark")
+
+import boto3  # noqa: E402
+from dynamodb_encryption_sdk.delegated_keys.jce import JceNameLocalDelegatedKey  # noqa: E402
+from dynamodb_encryption_sdk.encrypted.client import EncryptedClient  # noqa: E402
+from dynamodb_encryption_sdk.identifiers import CryptoAction  # noqa: E402
+from dynamodb_encryption_sdk.material_providers.aws_kms import (  # noqa: E402
+    AwsKmsCryptographicMaterialsProvider,
+)
+from dynamodb_encryption_sdk.material_providers.wrapped import (  # noqa: E402
+    WrappedCryptographicMaterialsProvider,
+)
+from dynamodb_encryption_sdk.structures import (  # noqa: E402
+    AttributeActions,
+    TableIndex,
+    TableInfo,
+)
+
+from app import constants, encryption  # noqa: E402
+
+ITEM = {
+    "pk": "USER#us-east-1:0b0d3c8e#ITEM#eVBnVMp7zdTJLkRNr33Rs6zr7KNJqBFL9DrE6",
+    "sk": "v0",
+    "institution_id": "ins_109508",
+    "institution_name": "First Platypus Bank",
+    "access_token": "access-sandbox-de3ce8ef-33f8-452c-a685-8671031fc0f6",
+    "link_session_id": "356dbb28-7f98-44d1-8e6d-0cec580f3171",
+    "created_at": "2024-07-12T11:00:05.123456+00:00",
+}
+
+
+def local_materials_provider() -> WrappedCryptographicMaterialsProvider:
+    """
+    Return a materials provider backed by in-memory keys instead of KMS
+    """
+    wrapping_key = JceNameLocalDelegatedKey.generate("AES", 256)
+    signing_key = JceNameLocalDelegatedKey.generate("HmacSHA512", 256)
+    return WrappedCryptographicMaterialsProvider(
+        signing_key=signing_key, wrapping_key=wrapping_key, unwrapping_key=wrapping_key
+    )
+
+
+def preload_table_info() -> None:
+    """
+    Give the shared EncryptedClient the table's key schema, so it skips DescribeTable
+    """
+    # the encryptor is partial(encrypt_put_item, encrypt, item_crypto_config, write), which
+    # wraps partial(crypto_config_from_cache, provider, actions, table_info_cache)
+    item_crypto_config = encryption._service.get_item_encryptor().args[1]
+    table_info_cache = item_crypto_config.args[0].args[2]
+    table_info_cache._all_tables_info[encryption.TABLE_NAME] = TableInfo(
+        name=encryption.TABLE_NAME, primary_index=TableIndex(partition="pk", sort="sk")
+    )
+
+
+# exchange_token shared a module-level resource, only the rest was built per request
+dynamodb = boto3.resource("dynamodb", config=constants.BOTO3_CONFIG)
+
+
+def previous_setup() -> EncryptedClient:
+    """
+    Build the clients the way exchange_token did before the shared service
+    """
+    aws_kms_cmp = AwsKmsCryptographicMaterialsProvider(key_id=encryption.KEY_ARN)
+    actions = AttributeActions(
+        default_action=CryptoAction.DO_NOTHING,
+        attribute_actions={"access_token": CryptoAction.ENCRYPT_AND_SIGN},
+    )
+    return EncryptedClient(
+        client=dynamodb.meta.client,
+        materials_provider=aws_kms_cmp,
+        attribute_actions=actions,
+        expect_standard_dictionaries=True,
+    )
+
+
+def bench(func: Callable[[], Any], number: int) -> float:
+    """
+    Return the best time per call in microseconds
+    """
+    # powertools prints metrics to stdout once 100 have been added
+    with contextlib.redirect_stdout(io.StringIO()):
+        timings = timeit.repeat(func, number=number, repeat=5)
+    return min(timings) / number * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--number", type=int, default=2000, help="calls per timing run")
+    args = parser.parse_args()
+
+    # swap KMS for local keys before the shared service builds its provider
+    provider = local_materials_provider()
+    encryption._service._materials_provider = encryption.CachingMaterialsProvider(provider)
+    preload_table_info()
+    encryption.encrypt_item(dict(ITEM))
+
+    results: Dict[str, float] = {
+        "client setup, per request (before)": bench(previous_setup, args.number),
+        "client setup, shared service (after)": bench(
+            encryption._service.get_item_encryptor, args.number
+        ),
+        "encrypt_item, shared service (after)": bench(
+            lambda: encryption.encrypt_item(dict(ITEM)), args.number
+        ),
+    }
+
+    # the same encryption without the materials cache, one data key per request
+    encryption._service._materials_provider = provider
+    encryption._service._encrypt_item = None
+    preload_table_info()
+    results["encrypt_item, uncached materials"] = bench(
+        lambda: encryption.encrypt_item(dict(ITEM)), args.number
+    )
+
+    for name, microseconds in results.items():
+        print(f"{name:<40}{microseconds:>12.2f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Micro-benchmark of API payload schema validation
+
+Compares schemas.validate, which reuses a validator compiled once per schema,
+with the powertools validate() the webhook handlers used to call, which
+compiles the schema again on every request. It covers the webhook, transfer
+webhook and link metadata payloads, plus a webhook with a missing item_id.
+
+Usage (with the backend/requirements-dev.txt packages installed):
+
+    python backend/benchmarks/api_schema_validation.py [--number 2000]
+"""
+
+import argparse
+import os
+import sys
+import timeit
+from typing import Any, Callable, Dict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "api"))
+
+from aws_lambda_powertools.utilities.validation import validate  # noqa: E402
+from aws_lambda_powertools.utilities.validation.exceptions import (  # noqa: E402
+    SchemaValidationError,
+)
+
+from app import schemas  # noqa: E402
+
+WEBHOOK = {
+    "environment": "production",
+    "error": None,
+    "item_id": "eVBnVMp7zdTJLkRNr33Rs6zr7KNJqBFL9DrE6",
+    "new_transactions": 3,
+    "webhook_code": "SYNC_UPDATES_AVAILABLE",
+    "webhook_type": "TRANSACTIONS",
+}
+
+TRANSFER_WEBHOOK = {
+    "environment": "production",
+    "webhook_code": "TRANSFER_EVENTS_UPDATE",
+    "webhook_type": "TRANSFER",
+}
+
+METADATA = {
+    "institution": {"institution_id": "ins_109508", "name": "First Platypus Bank"},
+    "accounts": [
+        {
+            "id": "BxBXxLj1m4HMXBm9WZZmCWVbPjX16EHwv99vp",
+            "name": "Plaid Checking",
+            "mask": "0000",
+            "type": "depository",
+            "subtype": "checking",
+        }
+    ],
+    "link_session_id": "356dbb28-7f98-44d1-8e6d-0cec580f3171",
+}
+
+INVALID_WEBHOOK = {key: value for key, value in WEBHOOK.items() if key != "item_id"}
+
+
+def catch_errors(func: Callable[..., None]) -> Callable[..., None]:
+    """
+    Wrap a validate function so rejected payloads can be timed too
+    """
+
+    def wrapper(event: Any, schema: Dict[str, Any]) -> None:
+        try:
+            func(event=event, schema=schema)
+        except SchemaValidationError:
+            pass
+
+    return wrapper
+
+
+def bench(func: Callable[..., None], event: Any, schema: Dict[str, Any], number: int) -> float:
+    """
+    Return the best time per call in microseconds
+    """
+    timings = timeit.repeat(lambda: func(event, schema), number=number, repeat=5)
+    return min(timings) / number * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--number", type=int, default=2000, help="calls per timing run")
+    args = parser.parse_args()
+
+    previous = catch_errors(validate)
+    current = catch_errors(schemas.validate)
+
+    print(f"{'payload':<18}{'powertools (us)':>18}{'compiled (us)':>16}{'speedup':>10}")
+    for name, event, schema in (
+        ("webhook", WEBHOOK, schemas.WEBHOOK_SCHEMA),
+        ("transfer webhook", TRANSFER_WEBHOOK, schemas.WEBHOOK_TRANSFER_SCHEMA),
+        ("link metadata", METADATA, schemas.METADATA_SCHEMA),
+        ("invalid webhook", INVALID_WEBHOOK, schemas.WEBHOOK_SCHEMA),
+    ):
+        before = bench(previous, event, schema, args.number)
+        after = bench(current, event, schema, args.number)
+        print(f"{name:<18}{before:>18.2f}{after:>16.2f}{before / after:>9.2f}x")
+
+
+if __name__ == "__main__":
+    main()
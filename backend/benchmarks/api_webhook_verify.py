@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Throughput benchmark of Plaid webhook verification
+
+Compares routers.webhook.verify, which reuses the public key constructed for
+each key ID and checks the cheap claims first, with the previous verify, which
+rebuilt the EC key from the JWK on every call. Tokens are signed with a local
+ES256 key in the format Plaid uses, and the key is preloaded into the key cache
+so no calls are made to Plaid or AWS.
+
+Usage (with the backend/requirements-dev.txt and backend/api packages installed):
+
+    python backend/benchmarks/api_webhook_verify.py [--number 2000]
+"""
+
+import argparse
+import base64
+import contextlib
+import hashlib
+import hmac
+import io
+import json
+import logging
+import os
+import sys
+import time
+import timeit
+from typing import Any, Callable, Dict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "api"))
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.setdefault("TABLE_NAME", "benchmark")
+os.environ.setdefault("POWERTOOLS_METRICS_NAMESPACE", "benchmark")
+os.environ.setdefault("POWERTOOLS_TRACE_DISABLED", "true")
+
+from cryptography.hazmat.primitives.asymmetric import ec  # noqa: E402
+from jose import jwt  # noqa: E402
+
+from app import constants, webhook_keys  # noqa: E402
+from app.routers import webhook  # noqa: E402
+
+KEY_ID = "6c5516e1-92dc-479e-a8ff-5a51992e0001"
+
+BODY = json.dumps(
+    {
+        "environment": "production",
+        "error": None,
+        "item_id": "eVBnVMp7zdTJLkRNr33Rs6zr7KNJqBFL9DrE6",
+        "new_transactions": 3,
+        "webhook_code": "SYNC_UPDATES_AVAILABLE",
+        "webhook_type": "TRANSACTIONS",
+    }
+)
+
+
+def _b64(value: int) -> str:
+    return base64.urlsafe_b64encode(value.to_bytes(32, "big")).rstrip(b"=").decode("ascii")
+
+
+def build_key_and_token(body: str) -> "tuple[Dict[str, Any], str]":
+    """
+    Return a Plaid style verification key and a webhook JWT signed with it
+    """
+    private_key = ec.generate_private_key(ec.SECP256R1())
+    numbers = private_key.public_key().public_numbers()
+    key = {
+        "alg": "ES256",
+        "created_at": int(time.time()),
+        "crv": "P-256",
+        "expired_at": None,
+        "kid": KEY_ID,
+        "kty": "EC",
+        "use": "sig",
+        "x": _b64(numbers.x),
+        "y": _b64(numbers.y),
+    }
+
+    claims = {
+        "iat": int(time.time()),
+        "request_body_sha256": hashlib.sha256(body.encode()).hexdigest(),
+    }
+    token = jwt.encode(claims, private_key, algorithm="ES256", headers={"kid": KEY_ID})
+    return key, token
+
+
+def previous_verify(key: Dict[str, Any], body: str, signed_jwt: str) -> bool:
+    """
+    Verify a webhook the way routers.webhook.verify did before the verifier cache
+    """
+    jwt.get_unverified_header(signed_jwt)["kid"]
+
+    if key["expired_at"] is not None:
+        return False
+
+    try:
+        claims = jwt.decode(signed_jwt, key, algorithms=["ES256"])
+    except jwt.JWTError:
+        return False
+
+    if claims["iat"] < time.time() - constants.TOKEN_EXPIRATION:
+        return False
+
+    body_hash = hashlib.sha256(body.encode()).hexdigest()
+    return hmac.compare_digest(body_hash, claims["request_body_sha256"])
+
+
+def bench(func: Callable[[], Any], number: int) -> float:
+    """
+    Return the best throughput in verifications per second
+    """
+    # powertools prints metrics to stdout once 100 have been added
+    with contextlib.redirect_stdout(io.StringIO()):
+        timings = timeit.repeat(func, number=number, repeat=5)
+    return number / min(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--number", type=int, default=2000, help="verifications per timing run")
+    args = parser.parse_args()
+
+    key, token = build_key_and_token(BODY)
+    tampered = BODY.replace('"new_transactions": 3', '"new_transactions": 4')
+
+    # skip the secret and key fetches, as a warm container would
+    webhook.CREDENTIALS = {"client_id": "benchmark", "client_secret": "benchmark"}
+    webhook_keys.key_cache.set(KEY_ID, key)
+
+    # rejections log a warning on every call, which would flood stderr
+    logging.disable(logging.WARNING)
+
+    assert previous_verify(key, BODY, token) and webhook.verify(BODY, token)
+    assert not previous_verify(key, tampered, token) and not webhook.verify(tampered, token)
+
+    cases: Dict[str, Dict[str, Callable[[], Any]]] = {
+        "valid webhook": {
+            "before": lambda: previous_verify(key, BODY, token),
+            "after": lambda: webhook.verify(BODY, token),
+        },
+        "tampered body": {
+            "before": lambda: previous_verify(key, tampered, token),
+            "after": lambda: webhook.verify(tampered, token),
+        },
+    }
+
+    print(f"{'case':<16}{'before (/s)':>14}{'after (/s)':>14}{'speedup':>10}")
+    for name, funcs in cases.items():
+        before = bench(funcs["before"], args.number)
+        after = bench(funcs["after"], args.number)
+        print(f"{name:<16}{before:>14.0f}{after:>14.0f}{after / before:>9.2f}x")
+
+
+if __name__ == "__main__":
+    main()
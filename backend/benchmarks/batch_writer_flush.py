@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark of batch_writer flush throughput against a simulated DynamoDB
+
+Times writer.write_requests for one full SQS batch of transaction writes, with
+flushes sent one after another (as Table.batch_writer did) and across the
+bounded thread pool. The simulated client adds a fixed latency per call and
+can leave a share of each flush unprocessed to exercise the backoff.
+
+Usage (with the backend/requirements-dev.txt and backend/batch_writer packages
+installed):
+
+    python backend/benchmarks/batch_writer_flush.py [--requests 100] [--latency 0.02]
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+import threading
+import time
+import timeit
+from typing import Any, Dict, List, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "batch_writer"))
+
+os.environ.setdefault("POWERTOOLS_METRICS_NAMESPACE", "benchmark")
+
+from app import writer  # noqa: E402
+
+TABLE_NAME = "benchmark"
+
+
+class SimulatedDynamoDBClient:
+    """
+    Stands in for the DynamoDB client calls the writer makes
+    """
+
+    def __init__(self, latency: float, unprocessed: float) -> None:
+        self.latency = latency
+        self.unprocessed = unprocessed
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def batch_write_item(self, RequestItems: Dict[str, List[Dict[str, Any]]]) -> Dict[str, Any]:
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.latency)
+
+        requests = RequestItems[TABLE_NAME]
+        pending = [request for request in requests if random.random() < self.unprocessed]
+        return {"UnprocessedItems": {TABLE_NAME: pending} if pending else {}}
+
+    def batch_get_item(self, RequestItems: Dict[str, Any]) -> Dict[str, Any]:
+        time.sleep(self.latency)
+        return {"Responses": {TABLE_NAME: []}}
+
+
+def build_requests(count: int) -> List[Dict[str, Any]]:
+    return [
+        {
+            "PutRequest": {
+                "Item": {
+                    "pk": f"USER#{i % 4}#ITEM#{i % 4}",
+                    "sk": f"TRANSACTION#{i:08d}",
+                    "amount": i,
+                }
+            }
+        }
+        for i in range(count)
+    ]
+
+
+def bench(
+    concurrency: int, requests: List[Dict[str, Any]], latency: float, unprocessed: float
+) -> Tuple[float, float]:
+    """
+    Return the best wall time in milliseconds and the calls made per run
+    """
+    writer.WRITER_MAX_CONCURRENCY = concurrency
+    client = SimulatedDynamoDBClient(latency, unprocessed)
+
+    # powertools prints metrics to stdout once 100 have been added
+    with contextlib.redirect_stdout(io.StringIO()):
+        timings = timeit.repeat(
+            lambda: writer.write_requests(client, TABLE_NAME, requests), number=1, repeat=5
+        )
+    return min(timings) * 1000, client.calls / 5
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=100, help="write requests per batch")
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds per call")
+    args = parser.parse_args()
+
+    requests = build_requests(args.requests)
+    concurrency = writer.WRITER_MAX_CONCURRENCY
+
+    print(f"{'unprocessed':<14}{'workers':>8}{'time (ms)':>12}{'calls':>8}")
+    for unprocessed in (0.0, 0.1):
+        for workers in (1, concurrency):
+            elapsed, calls = bench(workers, requests, args.latency, unprocessed)
+            print(f"{unprocessed:<14.0%}{workers:>8}{elapsed:>12.1f}{calls:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
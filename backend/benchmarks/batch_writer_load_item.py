@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Micro-benchmark of batch_writer item decoding
+
+Compares utils.load_item, which parses floats straight to Decimal, with the
+previous json.loads followed by a recursive floats_to_decimal pass, over
+transaction, holding and liability bodies shaped like the ones the webhook
+processor sends.
+
+Usage (with the backend/requirements-dev.txt packages installed):
+
+    python backend/benchmarks/batch_writer_load_item.py [--number 20000]
+"""
+
+import argparse
+import json
+import os
+import sys
+import timeit
+from decimal import Decimal
+from typing import Any, Callable, Dict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "batch_writer"))
+
+from app import utils  # noqa: E402
+
+TRANSACTION = {
+    "pk": "USER#us-east-1:0b0d3c8e#ITEM#eVBnVMp7zdTJLkRNr33Rs6zr7KNJqBFL9DrE6",
+    "sk": "TRANSACTION#lPNjeW1nR6CDn5okmGQ6hEpMo4lLNoSrzqDje",
+    "account_id": "BxBXxLj1m4HMXBm9WZZmCWVbPjX16EHwv99vp",
+    "amount": 2307.21,
+    "iso_currency_code": "USD",
+    "category": ["Shops", "Computers and Electronics"],
+    "date": "2024-07-12",
+    "datetime": "2024-07-12T11:00:00Z",
+    "location": {
+        "address": "300 Post St",
+        "city": "San Francisco",
+        "region": "CA",
+        "postal_code": "94108",
+        "country": "US",
+        "lat": 40.740352,
+        "lon": -74.001761,
+        "store_number": "1235",
+    },
+    "merchant_name": "Apple",
+    "name": "Apple Store",
+    "payment_channel": "in store",
+    "pending": False,
+    "personal_finance_category": {
+        "primary": "GENERAL_MERCHANDISE",
+        "detailed": "GENERAL_MERCHANDISE_ELECTRONICS",
+        "confidence_level": "VERY_HIGH",
+    },
+    "counterparties": [
+        {
+            "name": "Apple",
+            "type": "merchant",
+            "website": "apple.com",
+            "entity_id": "OdYD6ZRvL3yuKcYfVGM2Qb5L3Ea9wBmNKMgXb",
+            "confidence_level": "VERY_HIGH",
+        }
+    ],
+    "plaid_type": "Transaction",
+    "updated_at": "2024-07-12T11:00:05.123456+00:00",
+}
+
+HOLDING = {
+    "pk": "USER#us-east-1:0b0d3c8e#ITEM#eVBnVMp7zdTJLkRNr33Rs6zr7KNJqBFL9DrE6",
+    "sk": "SECURITY#d6ePmbPxgWCWmMVv66q9iPV94n91vMtov5Are#ACCOUNT#5Bvpj4QknlhVWk7GygpwfVKdd133GoCxB814g",
+    "account_id": "5Bvpj4QknlhVWk7GygpwfVKdd133GoCxB814g",
+    "security_id": "d6ePmbPxgWCWmMVv66q9iPV94n91vMtov5Are",
+    "cost_basis": 1.17,
+    "institution_price": 1.04,
+    "institution_price_as_of": "2024-07-11",
+    "institution_value": 2.08,
+    "iso_currency_code": "USD",
+    "quantity": 2.0,
+    "vested_quantity": 2.0,
+    "vested_value": 2.08,
+    "plaid_type": "Holding",
+    "updated_at": "2024-07-12T11:00:05.123456+00:00",
+}
+
+LIABILITY = {
+    "pk": "USER#us-east-1:0b0d3c8e#ITEM#eVBnVMp7zdTJLkRNr33Rs6zr7KNJqBFL9DrE6",
+    "sk": "LIABILITY#CREDIT#BxBXxLj1m4HMXBm9WZZmCWVbPjX16EHwv99vp",
+    "account_id": "BxBXxLj1m4HMXBm9WZZmCWVbPjX16EHwv99vp",
+    "aprs": [
+        {
+            "apr_percentage": 15.24,
+            "apr_type": "balance_transfer_apr",
+            "balance_subject_to_apr": 1562.32,
+            "interest_charge_amount": 130.22,
+        },
+        {
+            "apr_percentage": 27.95,
+            "apr_type": "cash_apr",
+            "balance_subject_to_apr": 56.22,
+            "interest_charge_amount": 14.81,
+        },
+        {
+            "apr_percentage": 12.5,
+            "apr_type": "purchase_apr",
+            "balance_subject_to_apr": 157.01,
+            "interest_charge_amount": 25.66,
+        },
+    ],
+    "is_overdue": False,
+    "last_payment_amount": 168.25,
+    "last_payment_date": "2024-06-16",
+    "last_statement_balance": 1708.77,
+    "last_statement_issue_date": "2024-06-28",
+    "minimum_payment_amount": 20.0,
+    "next_payment_due_date": "2024-07-28",
+    "plaid_type": "CreditCardLiability",
+    "updated_at": "2024-07-12T11:00:05.123456+00:00",
+}
+
+
+def floats_to_decimal(obj: Any) -> Any:
+    """
+    Convert floats to Decimal (the conversion load_item replaced)
+    """
+    if isinstance(obj, float):
+        obj = Decimal(str(obj))
+    elif isinstance(obj, dict):
+        for key, value in obj.items():
+            obj[key] = floats_to_decimal(value)
+    elif isinstance(obj, list):
+        obj = [floats_to_decimal(value) for value in obj]
+    return obj
+
+
+def previous_load_item(record: Dict[str, Any]) -> Dict[str, Any]:
+    return floats_to_decimal(json.loads(utils.decode_body(record)))
+
+
+def bench(func: Callable[[Dict[str, Any]], Any], record: Dict[str, Any], number: int) -> float:
+    """
+    Return the best time per call in microseconds
+    """
+    timings = timeit.repeat(lambda: func(record), number=number, repeat=5)
+    return min(timings) / number * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--number", type=int, default=20000, help="calls per timing run")
+    args = parser.parse_args()
+
+    print(f"{'body':<12}{'previous (us)':>16}{'load_item (us)':>16}{'speedup':>10}")
+    for name, body in (
+        ("transaction", TRANSACTION),
+        ("holding", HOLDING),
+        ("liability", LIABILITY),
+    ):
+        record = {"body": json.dumps(body), "messageAttributes": {}}
+        assert previous_load_item(record) == utils.load_item(record)
+
+        previous = bench(previous_load_item, record, args.number)
+        current = bench(utils.load_item, record, args.number)
+        print(f"{name:<12}{previous:>16.2f}{current:>16.2f}{previous / current:>9.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Cold-start benchmark of the webhook processor, from import to first record
+
+Each run starts a fresh interpreter, imports app.lambda_handler and prepares the
+products a typical webhook touches (transactions and accounts balance) with
+their AWS clients. "before" also builds the table resource and SQS client that
+each of the six products used to construct at import. No AWS calls are made.
+
+Usage (with the backend/requirements-dev.txt and backend/webhook_processor
+packages installed):
+
+    python backend/benchmarks/webhook_cold_start.py [--runs 10]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List
+
+WEBHOOK_PROCESSOR_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "webhook_processor"
+)
+
+# runs in the child interpreter, so the import is measured from a cold start
+CHILD = """
+import json
+import sys
+from timeit import default_timer
+
+started_at = default_timer()
+
+import app.lambda_handler
+from app import constants, products
+
+imported_at = default_timer()
+
+if sys.argv[1] == "before":
+    import boto3
+
+    session = boto3._get_default_session()
+    for _ in range(6):
+        session.resource("dynamodb", config=constants.BOTO3_CONFIG).Table("benchmark")
+        session.client("sqs", config=constants.BOTO3_CONFIG)
+
+for product_class in (products.Transactions, products.AccountsBalance):
+    product = products.get_product(product_class)
+    product.dynamodb
+    product.sqs
+
+print(json.dumps({"import": imported_at - started_at, "total": default_timer() - started_at}))
+"""
+
+
+def run(mode: str) -> Dict[str, float]:
+    env = dict(os.environ)
+    env.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    env.setdefault("KEY_ARN", "arn:aws:kms:us-east-1:111122223333:key/benchmark")
+    env.setdefault("TABLE_NAME", "benchmark")
+    env.setdefault("POWERTOOLS_METRICS_NAMESPACE", "benchmark")
+    env.setdefault("POWERTOOLS_TRACE_DISABLED", "true")
+
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD, mode],
+        cwd=WEBHOOK_PROCESSOR_DIR,
+        env=env,
+        capture_output=True,
+        check=True,
+        text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10, help="cold starts per mode")
+    args = parser.parse_args()
+
+    print(f"{'mode':<8}{'import (ms)':>14}{'to first record (ms)':>22}")
+    for mode in ("before", "after"):
+        results: List[Dict[str, float]] = [run(mode) for _ in range(args.runs)]
+        imported = statistics.median(result["import"] for result in results) * 1000
+        total = statistics.median(result["total"] for result in results) * 1000
+        print(f"{mode:<8}{imported:>14.1f}{total:>22.1f}")
+
+
+if __name__ == "__main__":
+    main()
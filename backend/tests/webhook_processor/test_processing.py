@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the concurrent SQS FIFO message group processor
+
+Usage (with the backend/requirements-dev.txt packages installed):
+
+    python -m unittest discover -s backend/tests/webhook_processor
+"""
+
+import os
+import sys
+import threading
+import time
+import unittest
+from typing import Any, Dict, List
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "webhook_processor")
+)
+
+os.environ.setdefault("POWERTOOLS_METRICS_NAMESPACE", "test")
+os.environ.setdefault("POWERTOOLS_TRACE_DISABLED", "true")
+
+from aws_lambda_powertools.utilities.data_classes.sqs_event import SQSRecord  # noqa: E402
+
+from app import processing  # noqa: E402
+
+
+def build_record(message_id: str, group_id: str) -> Dict[str, Any]:
+    return {
+        "messageId": message_id,
+        "receiptHandle": f"handle-{message_id}",
+        "body": "{}",
+        "attributes": {"MessageGroupId": group_id},
+        "messageAttributes": {},
+        "eventSource": "aws:sqs",
+    }
+
+
+class MessageGroupBatchProcessorTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.processor = processing.MessageGroupBatchProcessor(max_concurrency=4)
+        self.handled: List[str] = []
+        self.lock = threading.Lock()
+
+    def record_handler(self, record: SQSRecord) -> None:
+        with self.lock:
+            self.handled.append(record.message_id)
+        # let the other group run while this one is mid-record
+        time.sleep(0.001)
+        if record.message_id == "a1":
+            raise ValueError("failed")
+
+    def process(self, records: List[Dict[str, Any]]) -> List[str]:
+        with self.processor(records=records, handler=self.record_handler):
+            self.processor.process()
+
+        response = self.processor.response()
+        return sorted(failure["itemIdentifier"] for failure in response["batchItemFailures"])
+
+    def test_failed_group_does_not_fail_healthy_group(self) -> None:
+        records = [build_record("a1", "A"), build_record("a2", "A")] + [
+            build_record(f"b{i}", "B") for i in range(1, 6)
+        ]
+
+        # the groups interleave differently from run to run
+        for _ in range(20):
+            self.handled = []
+            self.assertEqual(self.process(records), ["a1", "a2"])
+            self.assertNotIn("a2", self.handled)
+            self.assertEqual(sorted(self.handled), ["a1", "b1", "b2", "b3", "b4", "b5"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import threading
+from typing import Any, Callable, Dict, Hashable, List, Set, Tuple, Union
+
+from aws_lambda_powertools import Logger
+from aws_lambda_powertools.metrics import MetricUnit
+from aws_lambda_powertools.utilities.data_classes.sqs_event import SQSRecord
+
+from app import constants, telemetry
+
+__all__ = ["BatchPlan"]
+
+logger = Logger(child=True)
+metrics = telemetry.BufferedMetrics()
+
+# Transactions webhooks that are all satisfied by a single /transactions/sync
+TRANSACTIONS_SYNC_CODES = frozenset(
+    [
+        constants.PLAID_WEBHOOK_CODE_INITIAL_UPDATE,
+        constants.PLAID_WEBHOOK_CODE_HISTORICAL_UPDATE,
+        constants.PLAID_WEBHOOK_CODE_DEFAULT_UPDATE,
+        constants.PLAID_WEBHOOK_CODE_SYNC_UPDATES_AVAILABLE,
+    ]
+)
+
+# Marker stored for work that completed without raising
+_DONE = object()
+
+
+def _webhook_family(webhook_type: str, webhook_code: str) -> str:
+    """
+    Return the group of webhook codes that are handled by the same work
+    """
+    if (
+        webhook_type == constants.PLAID_WEBHOOK_TYPE_TRANSACTIONS
+        and webhook_code in TRANSACTIONS_SYNC_CODES
+    ):
+        return "SYNC"
+    return webhook_code
+
+
+def _unique(values: List[Any]) -> List[Any]:
+    return list(dict.fromkeys(values))
+
+
+def _merge(
+    webhook_type: str,
+    current: Tuple[str, Dict[str, Any]],
+    webhook_code: str,
+    payload: Dict[str, Any],
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    Merge a webhook into the webhook already planned for the same item and family
+    """
+    current_code, current_payload = current
+    merged = dict(current_payload)
+
+    if webhook_type == constants.PLAID_WEBHOOK_TYPE_TRANSACTIONS:
+        if constants.PLAID_WEBHOOK_CODE_SYNC_UPDATES_AVAILABLE in (current_code, webhook_code):
+            # SYNC_UPDATES_AVAILABLE always syncs, so it supersedes the legacy codes
+            for key in ("initial_update_complete", "historical_update_complete"):
+                merged[key] = bool(current_payload.get(key)) or bool(payload.get(key))
+            return constants.PLAID_WEBHOOK_CODE_SYNC_UPDATES_AVAILABLE, merged
+
+        if webhook_code == constants.PLAID_WEBHOOK_CODE_TRANSACTIONS_REMOVED:
+            merged["removed_transactions"] = _unique(
+                current_payload.get("removed_transactions", [])
+                + payload.get("removed_transactions", [])
+            )
+            return current_code, merged
+
+        merged["new_transactions"] = current_payload.get("new_transactions", 0) + payload.get(
+            "new_transactions", 0
+        )
+        return current_code, merged
+
+    if webhook_type == constants.PLAID_WEBHOOK_TYPE_LIABILITIES:
+        merged["account_ids_with_new_liabilities"] = _unique(
+            current_payload.get("account_ids_with_new_liabilities", [])
+            + payload.get("account_ids_with_new_liabilities", [])
+        )
+        merged["account_ids_with_updated_liabilities"] = {
+            **current_payload.get("account_ids_with_updated_liabilities", {}),
+            **payload.get("account_ids_with_updated_liabilities", {}),
+        }
+        return current_code, merged
+
+    # holdings and investments transactions refetch everything, keep the latest payload
+    return webhook_code, payload
+
+
+class BatchPlan:
+    """
+    Execution plan that coalesces the webhooks in one batch of SQS records
+
+    Redundant webhooks for the same item are merged so their work runs once. The
+    outcome of each piece of work is remembered, so every record that depended on
+    it succeeds or fails together and BatchProcessor still reports per record.
+    """
+
+    def __init__(self) -> None:
+        self._webhooks: Dict[Tuple[str, str, str], Tuple[str, Dict[str, Any]]] = {}
+        self._forced_refreshes: Set[str] = set()
+        self._results: Dict[Hashable, Any] = {}
+        self._locks: Dict[Hashable, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_records(cls, records: List[Dict[str, Any]]) -> "BatchPlan":
+        """
+        Build a plan from the raw SQS records of a Lambda event
+        """
+        plan = cls()
+        planned = 0
+
+        for raw_record in records:
+            record = SQSRecord(raw_record)
+            attributes = record.message_attributes
+
+            if "ItemId" not in attributes or "WebhookType" not in attributes:
+                continue
+
+            try:
+                payload: Dict[str, Any] = json.loads(record.body)
+            except ValueError:
+                # reported when the record itself is handled
+                continue
+
+            plan.add(
+                item_id=attributes["ItemId"].string_value,
+                webhook_type=attributes["WebhookType"].string_value,
+                webhook_code=attributes["WebhookCode"].string_value,
+                payload=payload,
+                force_refresh="ForceRefresh" in attributes,
+            )
+            planned += 1
+
+        merged = planned - len(plan._webhooks)
+        if merged > 0:
+            logger.info(f"Coalesced {planned} webhooks into {len(plan._webhooks)}")
+            metrics.add_metric(name="WebhooksCoalesced", unit=MetricUnit.Count, value=merged)
+
+        return plan
+
+    def add(
+        self,
+        item_id: str,
+        webhook_type: str,
+        webhook_code: str,
+        payload: Dict[str, Any],
+        force_refresh: bool = False,
+    ) -> None:
+        """
+        Add a webhook to the plan, merging it with any planned webhook it overlaps
+        """
+        if force_refresh:
+            self._forced_refreshes.add(item_id)
+
+        key = (item_id, webhook_type, _webhook_family(webhook_type, webhook_code))
+        current = self._webhooks.get(key)
+        if current is None:
+            self._webhooks[key] = (webhook_code, payload)
+        else:
+            self._webhooks[key] = _merge(webhook_type, current, webhook_code, payload)
+
+    def webhook(
+        self, item_id: str, webhook_type: str, webhook_code: str, payload: Dict[str, Any]
+    ) -> Tuple[Hashable, str, Dict[str, Any]]:
+        """
+        Return the work key, code and payload of the merged webhook covering a record
+        """
+        key = (item_id, webhook_type, _webhook_family(webhook_type, webhook_code))
+        merged_code, merged_payload = self._webhooks.get(key, (webhook_code, payload))
+        return key, merged_code, merged_payload
+
+    def forces_refresh(self, item_id: str) -> bool:
+        """
+        Return True if any record in the batch asked to bypass the balance refresh throttle
+        """
+        return item_id in self._forced_refreshes
+
+    def run_once(self, key: Hashable, func: Callable[..., Any], *args: Any, **kwargs: Any) -> None:
+        """
+        Run func the first time key is seen, replaying its outcome on later calls
+        """
+        with self._lock:
+            lock = self._locks.setdefault(key, threading.Lock())
+
+        # records for different message groups may need the same work at the same time
+        with lock:
+            result: Union[BaseException, Any, None] = self._results.get(key)
+
+            if result is None:
+                try:
+                    func(*args, **kwargs)
+                except Exception as error:
+                    self._results[key] = error
+                    raise
+                self._results[key] = _DONE
+                return
+
+        metrics.add_metric(name="CoalescedWorkSkipped", unit=MetricUnit.Count, value=1)
+        if isinstance(result, BaseException):
+            raise result
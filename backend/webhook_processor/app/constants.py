@@ -26,6 +26,10 @@ PLAID_WEBHOOK_CODE_DEFAULT_UPDATE = "DEFAULT_UPDATE"
 PLAID_TRANSACTION_SYNC_COUNT_MAX = 500
 
 PLAID_INVESTMENTS_TRANSACTIONS_COUNT_MAX = 500
+PLAID_TRANSFER_EVENT_SYNC_COUNT_MAX = 500
+
+# Maximum number of keys in a single BatchGetItem call
+DYNAMODB_BATCH_GET_ITEM_MAX = 100
 
 DYNAMODB_EVENT_SOURCE = "aws:dynamodb"
 DYNAMODB_EVENT_TYPE_INSERT = "INSERT"
@@ -37,9 +41,33 @@ SQS_EVENT_SOURCE = "aws:sqs"
 # Maximum of messages SQS supports sending in a batch
 SQS_SEND_MESSAGE_BATCH_MAX = 10
 
+# Maximum total payload size (in bytes) of a single message and of a batch
+SQS_SEND_MESSAGE_BATCH_BYTES_MAX = 256 * 1024
+
+# Message attribute describing how the message body is encoded
+SQS_CONTENT_ENCODING_ATTRIBUTE_NAME = "ContentEncoding"
+SQS_CONTENT_ENCODING_JSON = "json"
+SQS_CONTENT_ENCODING_ZLIB = "zlib"
+
+# Attempts made to send entries that SQS reports as failed in a batch
+SQS_SEND_MAX_ATTEMPTS = 3
+
+# Base delay (in seconds) for the exponential backoff between SQS send attempts
+SQS_SEND_RETRY_BASE_DELAY = 0.1
+
 # DynamoDB attribute name for the Plaid access token
 TOKEN_ATTRIBUTE_NAME = "access_token"
 
 # DynamoDB attribute name for the cursor value
 CURSOR_ATTRIBUTE_NAME = "cursor"
-CURSOR_TRANSFER_ATTRIBUTE_NAME = "transfer_cursor"
\ No newline at end of file
+CURSOR_TRANSFER_ATTRIBUTE_NAME = "transfer_cursor"
+
+# DynamoDB attribute name for the cursor a transactions sync began paginating from,
+# only present while the sync is part way through its pages
+CURSOR_START_ATTRIBUTE_NAME = "cursor_start"
+
+# DynamoDB attribute name for the time of the last balance refresh of an item
+BALANCE_REFRESHED_AT_ATTRIBUTE_NAME = "balances_refreshed_at"
+
+# DynamoDB attribute name for the date investment transactions are synced through
+INVESTMENTS_WATERMARK_ATTRIBUTE_NAME = "investments_watermark"
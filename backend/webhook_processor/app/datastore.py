@@ -2,51 +2,108 @@
 # -*- coding: utf-8 -*-
 
 import os
+import threading
+import time
 from typing import Union, Dict, Any
 
-from aws_lambda_powertools import Logger, Metrics
+from aws_lambda_powertools import Logger
 from aws_lambda_powertools.metrics import MetricUnit
 import boto3
-from boto3.dynamodb.conditions import Key
+from boto3.dynamodb.conditions import Attr, Key
 import botocore
 from dynamodb_encryption_sdk.encrypted.table import EncryptedTable
 from dynamodb_encryption_sdk.identifiers import CryptoAction
-from dynamodb_encryption_sdk.material_providers.aws_kms import AwsKmsCryptographicMaterialsProvider
 from dynamodb_encryption_sdk.structures import AttributeActions
 from mypy_boto3_dynamodb import DynamoDBServiceResource
 from mypy_boto3_dynamodb.service_resource import Table
 
-from app import constants, exceptions
+from app import constants, encryption, exceptions, utils, telemetry
 
-__all__ = ["get_user_by_item", "get_item"]
+__all__ = [
+    "get_user_by_item",
+    "get_item",
+    "claim_balance_refresh",
+    "release_balance_refresh",
+]
 
 
 TABLE_NAME = os.getenv("TABLE_NAME")
 KEY_ARN = os.getenv("KEY_ARN")
 STAGE = os.getenv("STAGE")
+# Decrypted access tokens are cached for the life of a warm container
+ITEM_CACHE_SIZE = int(os.getenv("ITEM_CACHE_SIZE", "128"))
+ITEM_CACHE_TTL = float(os.getenv("ITEM_CACHE_TTL", "60"))  # seconds
+# Item to user mappings never change, unknown items are retried after a short TTL
+ITEM_USER_CACHE_SIZE = int(os.getenv("ITEM_USER_CACHE_SIZE", "1024"))
+ITEM_USER_CACHE_TTL = float(os.getenv("ITEM_USER_CACHE_TTL", "3600"))  # seconds
+ITEM_USER_NEGATIVE_CACHE_TTL = float(os.getenv("ITEM_USER_NEGATIVE_CACHE_TTL", "30"))  # seconds
+# Most recent balance refresh times known to this container, keyed by item ID
+BALANCE_REFRESH_CACHE_SIZE = int(os.getenv("BALANCE_REFRESH_CACHE_SIZE", "1024"))
 logger = Logger(child=True)
-metrics = Metrics()
+metrics = telemetry.BufferedMetrics()
 
-dynamodb: DynamoDBServiceResource = boto3.resource("dynamodb", config=constants.BOTO3_CONFIG)
-table: Table = dynamodb.Table(TABLE_NAME)
 default_action = CryptoAction.ENCRYPT_AND_SIGN if (STAGE == 'prod') else CryptoAction.DO_NOTHING
 
-aws_kms_cmp = AwsKmsCryptographicMaterialsProvider(key_id=KEY_ARN)
+aws_kms_cmp = encryption.build_materials_provider(KEY_ARN)
 actions = AttributeActions(
     default_action=default_action,
-    attribute_actions={constants.TOKEN_ATTRIBUTE_NAME: CryptoAction.ENCRYPT_AND_SIGN},
-)
-encrypted_table = EncryptedTable(
-    table=table,
-    materials_provider=aws_kms_cmp,
-    attribute_actions=actions,
+    attribute_actions={
+        constants.TOKEN_ATTRIBUTE_NAME: CryptoAction.ENCRYPT_AND_SIGN,
+        # sync state is written unencrypted with update_item, so it is never decrypted
+        constants.CURSOR_ATTRIBUTE_NAME: CryptoAction.DO_NOTHING,
+        constants.CURSOR_START_ATTRIBUTE_NAME: CryptoAction.DO_NOTHING,
+        constants.INVESTMENTS_WATERMARK_ATTRIBUTE_NAME: CryptoAction.DO_NOTHING,
+    },
 )
+# boto3 resources are not thread-safe and records are processed on worker threads,
+# so each thread builds its own table resources
+_tables = threading.local()
+_tables_lock = threading.Lock()
+item_cache = utils.LRUCache(max_size=ITEM_CACHE_SIZE, ttl=ITEM_CACHE_TTL)
+# Distinguishes a cached unknown item (None) from an item missing from the cache
+_NOT_CACHED = object()
+item_user_cache = utils.LRUCache(max_size=ITEM_USER_CACHE_SIZE, ttl=ITEM_USER_CACHE_TTL)
+balance_refresh_cache = utils.LRUCache(max_size=BALANCE_REFRESH_CACHE_SIZE)
+
+
+def _get_table() -> Table:
+    """
+    Return the DynamoDB table resource for the current thread
+    """
+    if not hasattr(_tables, "table"):
+        # creating resources from the shared default session is not thread-safe either
+        with _tables_lock:
+            dynamodb: DynamoDBServiceResource = boto3.resource(
+                "dynamodb", config=constants.BOTO3_CONFIG
+            )
+        _tables.table = dynamodb.Table(TABLE_NAME)
+        _tables.encrypted_table = EncryptedTable(
+            table=_tables.table,
+            materials_provider=aws_kms_cmp,
+            attribute_actions=actions,
+        )
+    return _tables.table
+
+
+def _get_encrypted_table() -> EncryptedTable:
+    """
+    Return the encrypted DynamoDB table for the current thread
+    """
+    _get_table()
+    return _tables.encrypted_table
 
 
 def get_user_by_item(item_id: str) -> Union[str, None]:
     """
     Return the user ID for a given item ID
     """
+    cached = item_user_cache.get(item_id, _NOT_CACHED)
+    if cached is not _NOT_CACHED:
+        metrics.add_metric(name="ItemUserCacheHit", unit=MetricUnit.Count, value=1)
+        return cached
+
+    metrics.add_metric(name="ItemUserCacheMiss", unit=MetricUnit.Count, value=1)
+
     params = {
         "ExpressionAttributeNames": {
             "#sk": "sk",
@@ -59,33 +116,30 @@ def get_user_by_item(item_id: str) -> Union[str, None]:
     logger.debug(params)
 
     try:
-        response = table.query(**params)
+        response = _get_table().query(**params)
     except botocore.exceptions.ClientError:
         logger.exception("Unable to get item from DynamoDB")
         raise
 
     for item in response.get("Items", []):
-        return item["sk"].replace("USER#", "")
+        user_id = item["sk"].replace("USER#", "")
+        item_user_cache.set(item_id, user_id)
+        return user_id
 
+    # the item may not have been stored yet, so only remember this briefly
+    item_user_cache.set(item_id, None, ttl=ITEM_USER_NEGATIVE_CACHE_TTL)
     return None
 
 
-def get_item(user_id: str, item_id: str) -> Dict[str, Any]:
+def _read_item(source: Union[Table, EncryptedTable], item_id: str, **params) -> Dict[str, Any]:
     """
-    Get the item from DynamoDB
+    Read an item record with a consistent read, raising if it does not exist
     """
-
-    params = {
-        "Key": {
-            "pk": f"USER#{user_id}#ITEM#{item_id}",
-            "sk": "v0",
-        },
-        "ConsistentRead": True,
-    }
+    params["ConsistentRead"] = True
     logger.debug(params)
 
     try:
-        response = encrypted_table.get_item(**params)
+        response = source.get_item(**params)
         metrics.add_metric(name="GetItemSuccess", unit=MetricUnit.Count, value=1)
     except botocore.exceptions.ClientError as error:
         if error.response["Error"]["Code"] == "ResourceNotFoundException":
@@ -99,51 +153,145 @@ def get_item(user_id: str, item_id: str) -> Dict[str, Any]:
     if not item:
         raise exceptions.ItemNotFoundException(f"Item {item_id} not found in DynamoDB")
 
+    return item
+
+
+def get_item(user_id: str, item_id: str) -> Dict[str, Any]:
+    """
+    Get the item from DynamoDB
+
+    The sync state (cursors and watermark) is always read consistently. Only the
+    decrypted access token is cached, and as the sync state is stored unencrypted a
+    cache hit reads it from the plain table, skipping the KMS round trip.
+    """
+
+    key = {
+        "pk": f"USER#{user_id}#ITEM#{item_id}",
+        "sk": "v0",
+    }
+    state_attribute_names = [
+        constants.CURSOR_ATTRIBUTE_NAME,
+        constants.CURSOR_START_ATTRIBUTE_NAME,
+        constants.INVESTMENTS_WATERMARK_ATTRIBUTE_NAME,
+    ]
+
+    access_token: Union[str, None] = item_cache.get((user_id, item_id))
+    if access_token is not None:
+        metrics.add_metric(name="ItemCacheHit", unit=MetricUnit.Count, value=1)
+
+        try:
+            item = _read_item(
+                _get_table(),
+                item_id,
+                Key=key,
+                # pk keeps the response non-empty for items that have no cursor yet
+                ProjectionExpression="pk, #c, #s, #w",
+                ExpressionAttributeNames={
+                    "#c": constants.CURSOR_ATTRIBUTE_NAME,
+                    "#s": constants.CURSOR_START_ATTRIBUTE_NAME,
+                    "#w": constants.INVESTMENTS_WATERMARK_ATTRIBUTE_NAME,
+                },
+            )
+        except exceptions.ItemNotFoundException:
+            item_cache.invalidate((user_id, item_id))
+            raise
+
+        item = {k: v for k, v in item.items() if k in state_attribute_names}
+        item[constants.TOKEN_ATTRIBUTE_NAME] = access_token
+        return item
+
+    metrics.add_metric(name="ItemCacheMiss", unit=MetricUnit.Count, value=1)
+
+    item = _read_item(_get_encrypted_table(), item_id, Key=key)
     item = {
         k: v
         for k, v in item.items()
-        if k in [constants.TOKEN_ATTRIBUTE_NAME, constants.CURSOR_ATTRIBUTE_NAME]
+        if k in [constants.TOKEN_ATTRIBUTE_NAME] + state_attribute_names
     }
+    item_cache.set((user_id, item_id), item[constants.TOKEN_ATTRIBUTE_NAME])
 
     return item
 
 
-def get_transfer(user_id: str, item_id: str) -> Dict[str, Any]:
+def claim_balance_refresh(item_id: str, min_interval: int, force: bool = False) -> bool:
     """
-    Get the item from DynamoDB
+    Record a balance refresh for an item, unless one happened within min_interval seconds
+
+    Returns False if the refresh should be skipped. The refresh time is kept on a
+    separate record so the encrypted item record is left untouched.
     """
+    now = int(time.time())
+
+    if not force:
+        refreshed_at: Union[int, None] = balance_refresh_cache.get(item_id)
+        if refreshed_at is not None and now - refreshed_at < min_interval:
+            return False
 
     params = {
         "Key": {
-            "pk": f"TRANSFER",
-            "sk": f"TRANSFER#{item_id}",
+            "pk": f"BALANCE_REFRESH#ITEM#{item_id}",
+            "sk": "v0",
+        },
+        "UpdateExpression": "SET #ts = :now, #ttl = :expire_at",
+        "ExpressionAttributeNames": {
+            "#ts": constants.BALANCE_REFRESHED_AT_ATTRIBUTE_NAME,
+            "#ttl": "expire_at",
+        },
+        "ExpressionAttributeValues": {
+            ":now": now,
+            ":expire_at": now + min_interval,
         },
-        "ConsistentRead": True,
     }
-    logger.debug(params)
+    if not force:
+        refreshed_at_attr = Attr(constants.BALANCE_REFRESHED_AT_ATTRIBUTE_NAME)
+        params["ConditionExpression"] = refreshed_at_attr.not_exists() | refreshed_at_attr.lte(
+            now - min_interval
+        )
+        params["ReturnValuesOnConditionCheckFailure"] = "ALL_OLD"
 
     try:
-        response = encrypted_table.get_item(**params)
-        metrics.add_metric(name="GetItemSuccess", unit=MetricUnit.Count, value=1)
+        _get_table().update_item(**params)
     except botocore.exceptions.ClientError as error:
-        if error.response["Error"]["Code"] == "ResourceNotFoundException":
-            raise exceptions.ItemNotFoundException(f"Item {item_id} not found in DynamoDB")
+        if error.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            logger.exception("Failed to update balance refresh time in DynamoDB")
+            raise
 
-        logger.exception("Failed to get item from DynamoDB")
-        metrics.add_metric(name="GetItemFailed", unit=MetricUnit.Count, value=1)
-        raise
+        # another invocation refreshed recently, remember when so later calls stay local
+        old_item = error.response.get("Item", {})
+        stored = old_item.get(constants.BALANCE_REFRESHED_AT_ATTRIBUTE_NAME, {}).get("N")
+        refreshed_at = int(stored) if stored else now
+        balance_refresh_cache.set(item_id, refreshed_at, ttl=refreshed_at + min_interval - now)
+        return False
 
-    item = response.get("Item", {})
-    if not item:
-        raise exceptions.ItemNotFoundException(f"Item {item_id} not found in DynamoDB")
+    balance_refresh_cache.set(item_id, now, ttl=min_interval)
+    return True
 
-    item = {
-        k: v
-        for k, v in item.items()
-        if k in [constants.TOKEN_ATTRIBUTE_NAME, constants.CURSOR_ATTRIBUTE_NAME]
+
+def release_balance_refresh(item_id: str) -> None:
+    """
+    Give up a balance refresh claim after the refresh failed, so it can be retried
+    """
+    claimed_at: Union[int, None] = balance_refresh_cache.get(item_id)
+    balance_refresh_cache.invalidate(item_id)
+
+    params = {
+        "Key": {
+            "pk": f"BALANCE_REFRESH#ITEM#{item_id}",
+            "sk": "v0",
+        },
     }
+    if claimed_at is not None:
+        # leave the record alone if another invocation has claimed a newer refresh
+        params["ConditionExpression"] = Attr(constants.BALANCE_REFRESHED_AT_ATTRIBUTE_NAME).eq(
+            claimed_at
+        )
 
-    return item
+    try:
+        _get_table().delete_item(**params)
+    except botocore.exceptions.ClientError as error:
+        if error.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            logger.exception("Failed to release balance refresh claim in DynamoDB")
+            raise
 
 
 def get_transfer_last_read() -> Dict[str, Any]:
@@ -161,7 +309,7 @@ def get_transfer_last_read() -> Dict[str, Any]:
     logger.debug(params)
 
     try:
-        response = encrypted_table.get_item(**params)
+        response = _get_encrypted_table().get_item(**params)
         metrics.add_metric(name="GetItemSuccess", unit=MetricUnit.Count, value=1)
     except botocore.exceptions.ClientError as error:
         if error.response["Error"]["Code"] == "ResourceNotFoundException":
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+from typing import Hashable, Tuple, Union
+
+from aws_lambda_powertools import Logger
+from aws_lambda_powertools.metrics import MetricUnit
+from dynamodb_encryption_sdk.material_providers import CryptographicMaterialsProvider
+from dynamodb_encryption_sdk.material_providers.aws_kms import AwsKmsCryptographicMaterialsProvider
+from dynamodb_encryption_sdk.materials import DecryptionMaterials, EncryptionMaterials
+from dynamodb_encryption_sdk.structures import EncryptionContext
+
+from app import utils, telemetry
+
+__all__ = ["CachingMaterialsProvider", "build_materials_provider"]
+
+# Maximum number of cached materials and how long (in seconds) they may be reused
+KMS_CACHE_SIZE = int(os.getenv("KMS_CACHE_SIZE", "256"))
+KMS_CACHE_MAX_AGE = float(os.getenv("KMS_CACHE_MAX_AGE", "300"))
+
+logger = Logger(child=True)
+metrics = telemetry.BufferedMetrics()
+
+
+class CachingMaterialsProvider(CryptographicMaterialsProvider):
+    """
+    Cryptographic materials provider that caches the materials returned by
+    another provider, so warm containers can reuse data keys instead of calling
+    KMS for every encrypted read or write.
+
+    The AWS KMS provider binds each data key to the table name and the key
+    attributes of the item, so materials are only ever reused for the same
+    item. Decryption materials are additionally keyed on the material
+    description, which holds the wrapped data key.
+    """
+
+    def __init__(
+        self,
+        materials_provider: CryptographicMaterialsProvider,
+        cache_size: int = KMS_CACHE_SIZE,
+        max_age: float = KMS_CACHE_MAX_AGE,
+    ) -> None:
+        self._materials_provider = materials_provider
+        self._encryption_cache = utils.LRUCache(max_size=cache_size, ttl=max_age)
+        self._decryption_cache = utils.LRUCache(max_size=cache_size, ttl=max_age)
+
+    @staticmethod
+    def _item_key(encryption_context: EncryptionContext) -> Tuple[Hashable, ...]:
+        attributes = encryption_context.attributes or {}
+        return (
+            encryption_context.table_name,
+            repr(attributes.get(encryption_context.partition_key_name)),
+            repr(attributes.get(encryption_context.sort_key_name)),
+        )
+
+    def decryption_materials(self, encryption_context: EncryptionContext) -> DecryptionMaterials:
+        description = encryption_context.material_description or {}
+        key = self._item_key(encryption_context) + tuple(sorted(description.items()))
+
+        materials: Union[DecryptionMaterials, None] = self._decryption_cache.get(key)
+        if materials is not None:
+            metrics.add_metric(name="KmsCacheHit", unit=MetricUnit.Count, value=1)
+            return materials
+
+        metrics.add_metric(name="KmsCacheMiss", unit=MetricUnit.Count, value=1)
+        materials = self._materials_provider.decryption_materials(encryption_context)
+        self._decryption_cache.set(key, materials)
+        return materials
+
+    def encryption_materials(self, encryption_context: EncryptionContext) -> EncryptionMaterials:
+        key = self._item_key(encryption_context)
+
+        materials: Union[EncryptionMaterials, None] = self._encryption_cache.get(key)
+        if materials is not None:
+            metrics.add_metric(name="KmsCacheHit", unit=MetricUnit.Count, value=1)
+            return materials
+
+        metrics.add_metric(name="KmsCacheMiss", unit=MetricUnit.Count, value=1)
+        materials = self._materials_provider.encryption_materials(encryption_context)
+        self._encryption_cache.set(key, materials)
+        return materials
+
+    def refresh(self) -> None:
+        self._encryption_cache.clear()
+        self._decryption_cache.clear()
+        self._materials_provider.refresh()
+
+
+def build_materials_provider(key_id: str) -> CryptographicMaterialsProvider:
+    """
+    Return the KMS materials provider, wrapped in a cache unless caching is disabled
+    """
+    aws_kms_cmp = AwsKmsCryptographicMaterialsProvider(key_id=key_id)
+
+    if KMS_CACHE_SIZE <= 0 or KMS_CACHE_MAX_AGE <= 0:
+        logger.debug("KMS materials caching is disabled")
+        return aws_kms_cmp
+
+    return CachingMaterialsProvider(aws_kms_cmp)
@@ -4,3 +4,11 @@
 
 class ItemNotFoundException(Exception):
     pass
+
+
+class MessageGroupCircuitBreakerError(Exception):
+    pass
+
+
+class SQSSendError(Exception):
+    pass
@@ -1,11 +1,16 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import time
+
+# Measured before any other import so the cold start metric covers them all
+IMPORT_STARTED_AT = time.perf_counter()
+
 import json
 import os
 from typing import List, Dict, Any, Union
 
-from aws_lambda_powertools import Logger, Tracer, Metrics
+from aws_lambda_powertools import Logger, Tracer
 from aws_lambda_powertools.metrics import MetricUnit
 from aws_lambda_powertools.utilities.batch import BatchProcessor, EventType
 from aws_lambda_powertools.utilities.data_classes.dynamo_db_stream_event import (
@@ -14,23 +19,25 @@ from aws_lambda_powertools.utilities.data_classes.dynamo_db_stream_event import
 from aws_lambda_powertools.utilities.data_classes.sqs_event import SQSRecord
 from aws_lambda_powertools.utilities.typing import LambdaContext
 
-from app import constants, products, datastore
+from app import coalesce, constants, products, datastore, processing, telemetry
 
 ENVIRONMENT = os.getenv("ENVIRONMENT", "dev")
+# Maximum number of SQS message groups (items) processed at the same time
+WEBHOOK_MAX_CONCURRENCY = int(os.getenv("WEBHOOK_MAX_CONCURRENCY", "4"))
 
 tracer = Tracer()
 logger = Logger(use_rfc3339=True, utc=True)
-metrics = Metrics()
+metrics = telemetry.BufferedMetrics()
 metrics.set_default_dimensions(environment=ENVIRONMENT)
 dynamodb_processor = BatchProcessor(event_type=EventType.DynamoDBStreams)
-sqs_processor = BatchProcessor(event_type=EventType.SQS)
+sqs_processor = processing.MessageGroupBatchProcessor(max_concurrency=WEBHOOK_MAX_CONCURRENCY)
+
+# Cleared once the first event has been received by this container
+cold_start_pending = True
+
+# Coalesced work for the SQS batch currently being processed
+batch_plan = coalesce.BatchPlan()
 
-transactions = products.Transactions()
-accounts_balance = products.AccountsBalance()
-liabilities = products.Liabilities()
-investments_transactions = products.InvestmentsTransactions()
-investments_holdings = products.InvestmentsHoldings()
-transfer = products.Transfer()
 
 def record_handler(record: Union[DynamoDBRecord, SQSRecord]) -> None:
     # New items added to DynamoDB via API
@@ -45,69 +52,109 @@ def record_handler(record: Union[DynamoDBRecord, SQSRecord]) -> None:
             logger.error(f"Skipping invalid DynamoDB key: {sk}")
             return
 
-        logger.append_keys(item_id=item_id, user_id=user_id)
+        logger.info(
+            "Syncing transactions for new item", extra={"item_id": item_id, "user_id": user_id}
+        )
         tracer.put_annotation(key="ItemId", value=item_id)
         tracer.put_annotation(key="UserId", value=user_id)
-        transactions.sync(user_id, item_id)
+        products.get_product(products.Transactions).sync(user_id, item_id)
 
     # Incoming Webhooks from SQS
     elif isinstance(record, SQSRecord):
-        
+
         webhook_type: str = record.message_attributes["WebhookType"].string_value
         webhook_code: str = record.message_attributes["WebhookCode"].string_value
 
-        if webhook_type == 'TRANSFER' and webhook_code == 'TRANSFER_EVENTS_UPDATE':
-            transfer.handle_webhook()
+        if webhook_type == "TRANSFER" and webhook_code == "TRANSFER_EVENTS_UPDATE":
+            transfer = products.get_product(products.Transfer)
+            batch_plan.run_once(("TRANSFER",), transfer.handle_webhook)
             return
         item_id: str = record.message_attributes["ItemId"].string_value
-        logger.append_keys(item_id=item_id)
         tracer.put_annotation(key="ItemId", value=item_id)
 
+        # records run on worker threads, so keys are passed per call rather than
+        # appended to the shared logger
+        log_keys = {"item_id": item_id}
+
         if "UserId" in record.message_attributes:
             user_id: str = record.message_attributes["UserId"].string_value
         else:
             user_id = datastore.get_user_by_item(item_id)
             if not user_id:
-                logger.warn(f"Item {item_id} not found")
+                logger.warn(f"Item {item_id} not found", extra=log_keys)
                 return
 
-        logger.append_keys(user_id=user_id)
+        log_keys["user_id"] = user_id
         tracer.put_annotation(key="UserId", value=user_id)
 
-
-
-        logger.info(f"Processing webhook type: {webhook_type}, code: {webhook_code}")
+        logger.info(
+            f"Processing webhook type: {webhook_type}, code: {webhook_code}", extra=log_keys
+        )
 
         try:
             payload: Dict[str, Any] = json.loads(record.body)
         except ValueError:
-            logger.exception(f"Webhook payload is invalid JSON: {record.body}")
+            logger.exception(f"Webhook payload is invalid JSON: {record.body}", extra=log_keys)
             return
 
-        # refresh all balances on the item
-        accounts_balance.get_balances(user_id, item_id)
+        # refresh all balances on the item, at most once per interval unless forced
+        accounts_balance = products.get_product(products.AccountsBalance)
+        batch_plan.run_once(
+            ("BALANCE", item_id),
+            accounts_balance.get_balances,
+            user_id,
+            item_id,
+            force=batch_plan.forces_refresh(item_id) or "ForceRefresh" in record.message_attributes,
+        )
+
+        # redundant webhooks for this item in the batch are merged and handled once
+        work_key, webhook_code, payload = batch_plan.webhook(
+            item_id, webhook_type, webhook_code, payload
+        )
 
         # https://plaid.com/docs/api/products/transactions/#webhooks
         if webhook_type == constants.PLAID_WEBHOOK_TYPE_TRANSACTIONS:
-            transactions.handle_webhook(user_id, item_id, webhook_code, payload)
+            transactions = products.get_product(products.Transactions)
+            batch_plan.run_once(
+                work_key, transactions.handle_webhook, user_id, item_id, webhook_code, payload
+            )
 
         # https://plaid.com/docs/api/products/liabilities/#webhooks
         elif webhook_type == constants.PLAID_WEBHOOK_TYPE_LIABILITIES:
-            liabilities.handle_webhook(user_id, item_id, webhook_code, payload)
+            liabilities = products.get_product(products.Liabilities)
+            batch_plan.run_once(
+                work_key, liabilities.handle_webhook, user_id, item_id, webhook_code, payload
+            )
 
         # https://plaid.com/docs/api/products/investments/#holdings-default_update
         elif webhook_type == constants.PLAID_WEBHOOK_TYPE_HOLDINGS:
-            investments_holdings.handle_webhook(user_id, item_id, webhook_code, payload)
+            investments_holdings = products.get_product(products.InvestmentsHoldings)
+            batch_plan.run_once(
+                work_key,
+                investments_holdings.handle_webhook,
+                user_id,
+                item_id,
+                webhook_code,
+                payload,
+            )
 
         # https://plaid.com/docs/api/products/investments/#investments_transactions-default_update
         elif webhook_type == constants.PLAID_WEBHOOK_TYPE_INVESTMENTS_TRANSACTIONS:
-            investments_transactions.handle_webhook(user_id, item_id, webhook_code, payload)
+            investments_transactions = products.get_product(products.InvestmentsTransactions)
+            batch_plan.run_once(
+                work_key,
+                investments_transactions.handle_webhook,
+                user_id,
+                item_id,
+                webhook_code,
+                payload,
+            )
 
         elif webhook_type == constants.PLAID_WEBHOOK_TYPE_BALANCE:
             pass
 
         else:
-            logger.warn(f"Unsupported webhook type: {webhook_type}")
+            logger.warn(f"Unsupported webhook type: {webhook_type}", extra=log_keys)
             metrics.add_metric(name="UnknownWebhookType", unit=MetricUnit.Count, value=1)
 
     else:
@@ -119,6 +166,15 @@ def record_handler(record: Union[DynamoDBRecord, SQSRecord]) -> None:
 @tracer.capture_lambda_handler
 @logger.inject_lambda_context(log_event=True)
 def handler(event: Dict[str, Any], context: LambdaContext) -> Dict[str, Any]:
+    global cold_start_pending
+
+    if cold_start_pending:
+        cold_start_pending = False
+        elapsed = time.perf_counter() - IMPORT_STARTED_AT
+        metrics.add_metric(
+            name="ColdStartToFirstRecord", unit=MetricUnit.Milliseconds, value=elapsed * 1000
+        )
+
     records: List[Dict[str, Any]] = event.get("Records", [])
     if not records:
         metrics.add_metric(name="EmptyRecords", unit=MetricUnit.Count, value=1)
@@ -132,6 +188,9 @@ def handler(event: Dict[str, Any], context: LambdaContext) -> Dict[str, Any]:
 
         return dynamodb_processor.response()
     elif event_source == constants.SQS_EVENT_SOURCE:
+        global batch_plan
+        batch_plan = coalesce.BatchPlan.from_records(records)
+
         with sqs_processor(records=records, handler=record_handler):
             sqs_processor.process()
 
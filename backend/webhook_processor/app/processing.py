@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from concurrent.futures import ThreadPoolExecutor
+import sys
+from typing import Any, Dict, List, Tuple
+
+from aws_lambda_powertools import Logger, Tracer
+from aws_lambda_powertools.metrics import MetricUnit
+from aws_lambda_powertools.utilities.batch import (
+    BatchProcessor,
+    ExceptionInfo,
+    FailureResponse,
+    SqsFifoPartialProcessor,
+)
+
+from app import exceptions, telemetry
+
+__all__ = ["MessageGroupBatchProcessor"]
+
+tracer = Tracer()
+logger = Logger(child=True)
+metrics = telemetry.BufferedMetrics()
+
+
+class MessageGroupBatchProcessor(SqsFifoPartialProcessor):
+    """
+    Process SQS FIFO records concurrently across message groups
+
+    Records within a message group are processed in order, and once one fails the
+    rest of its group is reported as failed without being processed so SQS retries
+    them in order. Different message groups are independent and run in parallel.
+    This matches SqsFifoPartialProcessor with skip_group_on_error, which it extends,
+    but the failure state is kept per group rather than on the shared instance.
+    """
+
+    def __init__(self, max_concurrency: int = 4) -> None:
+        super().__init__(skip_group_on_error=True)
+        self.max_concurrency = max_concurrency
+
+    def process(self) -> List[Tuple]:
+        groups: Dict[str, List[Dict[str, Any]]] = {}
+        for record in self.records:
+            group_id: str = record.get("attributes", {}).get("MessageGroupId", "")
+            groups.setdefault(group_id, []).append(record)
+
+        max_workers = min(self.max_concurrency, len(groups))
+        metrics.add_metric(name="MessageGroupCount", unit=MetricUnit.Count, value=len(groups))
+        logger.debug(f"Processing {len(self.records)} records in {len(groups)} message groups")
+
+        if max_workers <= 1:
+            results = [self._process_group(group) for group in groups.values()]
+        else:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                results = list(executor.map(self._process_group, groups.values()))
+
+        # metrics are only added from this thread, powertools metrics are not thread-safe
+        for _, collected in results:
+            metrics.add_metrics(collected)
+
+        return [result for group_results, _ in results for result in group_results]
+
+    def _process_group(
+        self, records: List[Dict[str, Any]]
+    ) -> Tuple[List[Tuple], List[Dict[str, Any]]]:
+        """
+        Process the records of one message group in order, stopping at the first failure
+
+        Returns the results along with the metrics collected while processing them.
+        """
+        results: List[Tuple] = []
+        group_id: str = records[0].get("attributes", {}).get("MessageGroupId", "")
+
+        # on a worker thread the X-Ray trace entity is Lambda's facade segment, which can't
+        # be annotated, so each group gets its own subsegment for the handler's annotations
+        with tracer.provider.in_subsegment(name="## message group") as subsegment:
+            subsegment.put_annotation(key="MessageGroupId", value=group_id)
+
+            with telemetry.collect_metrics() as collected:
+                for index, record in enumerate(records):
+                    # SqsFifoPartialProcessor._process_record tracks the current group on the
+                    # instance, which every worker shares
+                    result = BatchProcessor._process_record(self, record)
+                    results.append(result)
+
+                    if result[0] == "fail":
+                        for skipped in records[index + 1 :]:
+                            results.append(self._short_circuit(skipped))
+                        break
+
+        return results, collected
+
+    def failure_handler(self, record, exception: ExceptionInfo) -> FailureResponse:
+        # failed groups are short-circuited by _process_group, not through the group ID
+        # SqsFifoPartialProcessor records on the shared instance
+        return BatchProcessor.failure_handler(self, record, exception)
+
+    def _short_circuit(self, record: Dict[str, Any]) -> Tuple:
+        """
+        Report a record as failed without processing it
+        """
+        try:
+            raise exceptions.MessageGroupCircuitBreakerError(
+                "A previous record in the message group failed processing"
+            )
+        except exceptions.MessageGroupCircuitBreakerError:
+            return self.failure_handler(
+                record=self._to_batch_type(record, event_type=self.event_type, model=self.model),
+                exception=sys.exc_info(),
+            )
@@ -8,6 +8,8 @@ from .investments_transactions import InvestmentsTransactions
 from .liabilities import Liabilities
 from .transactions import Transactions
 from .transfer import Transfer
+from .registry import get_product
+
 __all__ = [
     "AbstractProduct",
     "AccountsBalance",
@@ -15,5 +17,6 @@ __all__ = [
     "InvestmentsTransactions",
     "Liabilities",
     "Transactions",
-    "Transfer"
+    "Transfer",
+    "get_product",
 ]
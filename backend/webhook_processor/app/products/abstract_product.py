@@ -2,10 +2,14 @@
 # -*- coding: utf-8 -*-
 
 from abc import ABC
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import os
-from typing import Dict, Any, List
+import random
+import threading
+import time
+from typing import Dict, Any, List, Tuple, Union
 
-from aws_lambda_powertools import Logger, Metrics
+from aws_lambda_powertools import Logger
 from aws_lambda_powertools.metrics import MetricUnit
 import boto3
 import botocore
@@ -14,33 +18,88 @@ from mypy_boto3_dynamodb.service_resource import Table
 from mypy_boto3_sqs import SQSClient
 from plaid.api import plaid_api
 
-from app import utils, constants
+from app import utils, constants, exceptions, telemetry
 
 __all__ = ["AbstractProduct"]
 
 QUEUE_URL = os.getenv("QUEUE_URL")
 TABLE_NAME = os.getenv("TABLE_NAME")
+# Maximum number of SendMessageBatch calls in flight at once
+SQS_SEND_CONCURRENCY = int(os.getenv("SQS_SEND_CONCURRENCY", "8"))
+# Encoding applied to every message body ("json" to send as-is, "zlib" to compress)
+MESSAGE_BODY_ENCODING = os.getenv(
+    "MESSAGE_BODY_ENCODING", constants.SQS_CONTENT_ENCODING_JSON
+).lower()
 
 logger = Logger(child=True)
-metrics = Metrics()
+metrics = telemetry.BufferedMetrics()
+
+
+_clients_lock = threading.Lock()
+# boto3 resources are not thread-safe, so tables are kept per thread (clients are shared)
+_tables = threading.local()
+_sqs_clients: Dict[boto3.Session, SQSClient] = {}
+
+
+def _get_table(session: boto3.Session) -> Table:
+    """
+    Return the DynamoDB table used by every product on this thread with this session
+    """
+    tables: Union[Dict[boto3.Session, Table], None] = getattr(_tables, "by_session", None)
+    if tables is None:
+        tables = _tables.by_session = {}
+
+    if session not in tables:
+        with _clients_lock:
+            dynamodb: DynamoDBServiceResource = session.resource(
+                "dynamodb", config=constants.BOTO3_CONFIG
+            )
+        tables[session] = dynamodb.Table(TABLE_NAME)
+    return tables[session]
+
+
+def _get_sqs_client(session: boto3.Session) -> SQSClient:
+    """
+    Return the SQS client shared by every product using this session
+    """
+    with _clients_lock:
+        if session not in _sqs_clients:
+            _sqs_clients[session] = session.client("sqs", config=constants.BOTO3_CONFIG)
+        return _sqs_clients[session]
 
 
 class AbstractProduct(ABC):
     def __init__(self, client: plaid_api.PlaidApi = None, session: boto3.Session = None):
-        if not session:
-            session = boto3._get_default_session()
-        if not client:
-            client = utils.get_plaid_client()
+        self._client = client
+        self._session = session
 
-        self.client = client
+    @property
+    def session(self) -> boto3.Session:
+        if self._session is None:
+            return boto3._get_default_session()
+        return self._session
 
-        dynamodb: DynamoDBServiceResource = session.resource(
-            "dynamodb", config=constants.BOTO3_CONFIG
-        )
-        self.dynamodb: Table = dynamodb.Table(TABLE_NAME)
-        self.sqs: SQSClient = session.client("sqs", config=constants.BOTO3_CONFIG)
+    @property
+    def dynamodb(self) -> Table:
+        return _get_table(self.session)
+
+    @property
+    def sqs(self) -> SQSClient:
+        return _get_sqs_client(self.session)
+
+    @property
+    def client(self) -> plaid_api.PlaidApi:
+        """
+        Plaid client, defaulting to the shared process-wide client
+        """
+        if self._client is not None:
+            return self._client
+        return utils.get_plaid_client()
 
     def send_messages(self, messages: List[Dict[str, Any]]) -> None:
+        """
+        Send messages to SQS, raising SQSSendError if any of them could not be sent
+        """
         # remove any messages that are None
         messages = list(filter(None, messages))
 
@@ -49,45 +108,162 @@ class AbstractProduct(ABC):
             logger.warn("Not sending empty batch of messages")
             return
 
-        for batch in utils.chunk_list(messages, constants.SQS_SEND_MESSAGE_BATCH_MAX):
-            self._send_messages(batch)
-
-    def _send_messages(self, messages: List[Dict[str, Any]]) -> None:
-        """
-        Batch send a list of messages to SQS
-        """
-
         message_count = len(messages)
-        if not message_count:
-            metrics.add_metric(name="SQSEmptyBatch", unit=MetricUnit.Count, value=1)
-            logger.warn("Not sending empty batch of messages")
-            return
+        messages = self._encode_messages(messages)
+        dropped = message_count - len(messages)
 
-        if message_count > constants.SQS_SEND_MESSAGE_BATCH_MAX:
-            metrics.add_metric(name="SQSBatchTooLarge", unit=MetricUnit.Count, value=1)
-            raise Exception(
-                f"Too many messages in SQS batch: {message_count} > {constants.SQS_SEND_MESSAGE_BATCH_MAX}"
-            )
+        batches = []
+        for batch in utils.pack_messages(messages):
+            # checked here rather than in _send_messages so metrics stay on this thread
+            if not batch:
+                metrics.add_metric(name="SQSEmptyBatch", unit=MetricUnit.Count, value=1)
+                logger.warn("Not sending empty batch of messages")
+                continue
+            if len(batch) > constants.SQS_SEND_MESSAGE_BATCH_MAX:
+                metrics.add_metric(name="SQSBatchTooLarge", unit=MetricUnit.Count, value=1)
+                raise Exception(
+                    f"Too many messages in SQS batch: {len(batch)} > {constants.SQS_SEND_MESSAGE_BATCH_MAX}"
+                )
+            batches.append(batch)
 
-        logger.debug(f"Sending {len(messages)} messages to SQS")
+        max_workers = min(SQS_SEND_CONCURRENCY, len(batches))
 
-        params = {
-            "QueueUrl": QUEUE_URL,
-            "Entries": messages,
-        }
+        successful = 0
+        failed = 0
+        started = time.perf_counter()
 
         try:
-            response = self.sqs.send_message_batch(**params)
+            if max_workers <= 1:
+                for batch in batches:
+                    batch_successful, batch_failed = self._send_messages(batch)
+                    successful += batch_successful
+                    failed += batch_failed
+            else:
+                with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                    futures = [executor.submit(self._send_messages, batch) for batch in batches]
+                    for future in as_completed(futures):
+                        batch_successful, batch_failed = future.result()
+                        successful += batch_successful
+                        failed += batch_failed
         except botocore.exceptions.ClientError:
-            logger.exception("Failed to send messages to SQS")
             metrics.add_metric(name="SQSSendException", unit=MetricUnit.Count, value=1)
             raise
+        finally:
+            elapsed = time.perf_counter() - started
+
+            if successful:
+                metrics.add_metric(name="SQSSendSuccess", unit=MetricUnit.Count, value=successful)
+            if failed:
+                metrics.add_metric(name="SQSSendFailed", unit=MetricUnit.Count, value=failed)
+
+            metrics.add_metric(
+                name="SQSSendLatency", unit=MetricUnit.Milliseconds, value=elapsed * 1000
+            )
+            if elapsed > 0:
+                metrics.add_metric(
+                    name="SQSSendThroughput",
+                    unit=MetricUnit.CountPerSecond,
+                    value=successful / elapsed,
+                )
+
+        logger.debug(
+            f"Sent {successful} messages ({failed} failed) in {len(batches)} batches using {max_workers} workers in {elapsed:.3f}s"
+        )
+
+        if failed or dropped:
+            raise exceptions.SQSSendError(
+                f"Failed to send {failed + dropped} of {message_count} messages to SQS ({dropped} too large)"
+            )
+
+    def _encode_messages(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Compress message bodies when the compact encoding is enabled or when a
+        message is too large to send as-is, dropping any message that still
+        exceeds the SQS payload limit
+        """
+        encoded: List[Dict[str, Any]] = []
+        compress_all = MESSAGE_BODY_ENCODING == constants.SQS_CONTENT_ENCODING_ZLIB
+        original_bytes = 0
+        encoded_bytes = 0
+
+        for message in messages:
+            size = utils.message_size(message)
+            original_bytes += size
+
+            if compress_all or size > constants.SQS_SEND_MESSAGE_BATCH_BYTES_MAX:
+                compressed = utils.compress_message(message)
+                compressed_size = utils.message_size(compressed)
+
+                # small bodies can grow once base64 encoded, so only keep smaller ones
+                if compressed_size < size:
+                    message = compressed
+                    size = compressed_size
+                    metrics.add_metric(name="SQSMessageCompressed", unit=MetricUnit.Count, value=1)
+
+            if size > constants.SQS_SEND_MESSAGE_BATCH_BYTES_MAX:
+                logger.error(
+                    f"Message {message['Id']} is too large to send to SQS: {message['MessageAttributes']}"
+                )
+                metrics.add_metric(name="SQSMessageTooLarge", unit=MetricUnit.Count, value=1)
+                continue
+
+            encoded_bytes += size
+            encoded.append(message)
+
+        if compress_all and original_bytes:
+            metrics.add_metric(
+                name="SQSSendBytesSaved",
+                unit=MetricUnit.Bytes,
+                value=original_bytes - encoded_bytes,
+            )
+
+        return encoded
+
+    def _send_messages(self, messages: List[Dict[str, Any]]) -> Tuple[int, int]:
+        """
+        Batch send a list of messages to SQS, retrying any entries that failed
+
+        Returns the number of successful and failed messages. This is called from
+        worker threads, so metrics and batch validation are left to the caller.
+        """
+
+        message_count = len(messages)
+        successful = 0
+        pending = messages
+
+        for attempt in range(constants.SQS_SEND_MAX_ATTEMPTS):
+            if attempt:
+                # exponential backoff with full jitter between retries
+                time.sleep(random.uniform(0, constants.SQS_SEND_RETRY_BASE_DELAY * 2**attempt))
+
+            logger.debug(f"Sending {len(pending)} messages to SQS (attempt {attempt + 1})")
+
+            params = {
+                "QueueUrl": QUEUE_URL,
+                "Entries": pending,
+            }
+
+            try:
+                response = self.sqs.send_message_batch(**params)
+            except botocore.exceptions.ClientError:
+                logger.exception("Failed to send messages to SQS")
+                raise
+
+            successful += len(response.get("Successful", []))
+
+            failed = response.get("Failed", [])
+            # sender faults from earlier attempts are not retried, so they still count
+            if not failed:
+                return successful, message_count - successful
+
+            # Sender faults (e.g. an invalid message) will never succeed on retry
+            retryable_ids = {entry["Id"] for entry in failed if not entry.get("SenderFault")}
+            if len(retryable_ids) < len(failed):
+                logger.error([entry for entry in failed if entry.get("SenderFault")])
 
-        successful = response.get("Successful", [])
-        if successful:
-            metrics.add_metric(name="SQSSendSuccess", unit=MetricUnit.Count, value=len(successful))
+            pending = [message for message in pending if message["Id"] in retryable_ids]
+            if not pending:
+                return successful, message_count - successful
 
-        failed = response.get("Failed", [])
-        if failed:
-            metrics.add_metric(name="SQSSendFailed", unit=MetricUnit.Count, value=len(failed))
-            logger.error(failed)
+        logger.error(f"Failed to send {len(pending)} messages to SQS after retries")
+        return successful, message_count - successful
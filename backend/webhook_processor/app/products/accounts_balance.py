@@ -2,9 +2,10 @@
 # -*- coding: utf-8 -*-
 
 import datetime
+import os
 from typing import Dict, Any, List
 
-from aws_lambda_powertools import Logger, Metrics
+from aws_lambda_powertools import Logger
 from aws_lambda_powertools.metrics import MetricUnit
 import plaid
 from plaid.model.accounts_get_request_options import AccountsGetRequestOptions
@@ -12,13 +13,16 @@ from plaid.model.accounts_get_request import AccountsGetRequest
 from plaid.model.accounts_get_response import AccountsGetResponse
 from plaid.model.account_base import AccountBase
 
-from app import utils, exceptions, datastore, constants
+from app import utils, exceptions, datastore, constants, telemetry
 from app.products import AbstractProduct
 
 __all__ = ["AccountsBalance"]
 
+# Minimum number of seconds between balance refreshes of the same item
+BALANCE_REFRESH_MIN_INTERVAL = int(os.getenv("BALANCE_REFRESH_MIN_INTERVAL", "300"))
+
 logger = Logger(child=True)
-metrics = Metrics()
+metrics = telemetry.BufferedMetrics()
 
 
 class AccountsBalance(AbstractProduct):
@@ -63,9 +67,24 @@ class AccountsBalance(AbstractProduct):
 
         return message
 
-    def get_balances(self, user_id: str, item_id: str) -> None:
+    def get_balances(self, user_id: str, item_id: str, force: bool = False) -> None:
         logger.debug("Begin accounts balance get")
 
+        if not datastore.claim_balance_refresh(item_id, BALANCE_REFRESH_MIN_INTERVAL, force=force):
+            logger.debug(f"Balances refreshed within {BALANCE_REFRESH_MIN_INTERVAL}s, skipping")
+            metrics.add_metric(name="BalanceRefreshThrottled", unit=MetricUnit.Count, value=1)
+            return
+
+        try:
+            self._refresh_balances(user_id, item_id)
+        except Exception:
+            # only a successful refresh should hold off the next one
+            datastore.release_balance_refresh(item_id)
+            raise
+
+        logger.debug("End accounts balance get")
+
+    def _refresh_balances(self, user_id: str, item_id: str) -> None:
         try:
             item = datastore.get_item(user_id, item_id)
         except exceptions.ItemNotFoundException:
@@ -104,5 +123,3 @@ class AccountsBalance(AbstractProduct):
                 messages.append(self.build_message(user_id, item_id, account, today=today))
 
             self.send_messages(messages)
-
-        logger.debug("End accounts balance get")
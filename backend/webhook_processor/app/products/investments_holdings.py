@@ -1,10 +1,15 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-from typing import Dict, Any, List, Union
+import hashlib
+import os
+import time
+from typing import Dict, Any, Iterator, List, Set, Tuple, Union
 
-from aws_lambda_powertools import Logger, Metrics
+from aws_lambda_powertools import Logger
 from aws_lambda_powertools.metrics import MetricUnit
+from boto3.dynamodb.conditions import Key
+import botocore
 import plaid
 from plaid.model.investments_holdings_get_request import InvestmentsHoldingsGetRequest
 from plaid.model.investment_holdings_get_request_options import InvestmentHoldingsGetRequestOptions
@@ -13,13 +18,20 @@ from plaid.model.account_base import AccountBase
 from plaid.model.holding import Holding
 from plaid.model.security import Security
 
-from app import constants, exceptions, utils, datastore
+from app import constants, exceptions, utils, datastore, telemetry
 from app.products import AbstractProduct
 
 __all__ = ["InvestmentsHoldings"]
 
+# Snapshots expire so every position is periodically rewritten in full
+HOLDINGS_SNAPSHOT_TTL = int(os.getenv("HOLDINGS_SNAPSHOT_TTL", str(7 * 24 * 60 * 60)))  # seconds
+
+# The snapshot is stored as one record per account, so its size is bounded by the
+# positions in a single account rather than the whole portfolio
+HOLDINGS_SNAPSHOT_SK_PREFIX = "SNAPSHOT#HOLDINGS#ACCOUNT#"
+
 logger = Logger(child=True)
-metrics = Metrics()
+metrics = telemetry.BufferedMetrics()
 
 
 class InvestmentsHoldings(AbstractProduct):
@@ -104,6 +116,166 @@ class InvestmentsHoldings(AbstractProduct):
 
         return message
 
+    def build_delete_message(self, user_id: str, item_id: str, sk: str) -> Dict[str, Any]:
+        """
+        Build an SQS message that deletes a holding which is no longer held
+        """
+        body = {
+            "pk": f"USER#{user_id}#ITEM#{item_id}",
+            "sk": sk,
+        }
+
+        return {
+            "DelaySeconds": 0,
+            "Id": utils.generate_id(),
+            "MessageAttributes": {
+                "ItemId": {
+                    "StringValue": item_id,
+                    "DataType": "String",
+                },
+                "UserId": {
+                    "StringValue": user_id,
+                    "DataType": "String",
+                },
+                "EventName": {
+                    "StringValue": "DELETE",
+                    "DataType": "String",
+                },
+            },
+            "MessageBody": utils.json_dumps(body),
+        }
+
+    def _query(self, **params) -> Iterator[Dict[str, Any]]:
+        """
+        Yield every item matching a query, following pagination
+        """
+        while True:
+            try:
+                response = self.dynamodb.query(**params)
+            except botocore.exceptions.ClientError:
+                logger.exception("Failed to query DynamoDB")
+                raise
+
+            yield from response.get("Items", [])
+
+            if "LastEvaluatedKey" not in response:
+                return
+            params["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+    @staticmethod
+    def _split_holding_sk(sk: str) -> Tuple[str, str]:
+        """
+        Return the security ID and account ID of a holding sort key
+        """
+        security_id, account_id = sk[len("SECURITY#") :].split("#ACCOUNT#", 1)
+        return security_id, account_id
+
+    def get_snapshot(self, user_id: str, item_id: str) -> Dict[str, str]:
+        """
+        Return the holding digests from the last sync, keyed by holding sort key
+
+        Without a snapshot, or once any of its account records has expired, the
+        stored holdings are listed instead, with empty digests so every current
+        holding is treated as changed.
+        """
+        pk = f"USER#{user_id}#ITEM#{item_id}"
+        now = time.time()
+
+        snapshot: Dict[str, str] = {}
+        found = False
+        expired = False
+
+        for shard in self._query(
+            KeyConditionExpression=Key("pk").eq(pk)
+            & Key("sk").begins_with(HOLDINGS_SNAPSHOT_SK_PREFIX),
+            ConsistentRead=True,
+        ):
+            found = True
+            if shard.get("expire_at", 0) <= now:
+                expired = True
+                break
+
+            account_id = shard["sk"][len(HOLDINGS_SNAPSHOT_SK_PREFIX) :]
+            for security_id, digest in shard.get("holdings", {}).items():
+                snapshot[f"SECURITY#{security_id}#ACCOUNT#{account_id}"] = digest
+
+        if found and not expired:
+            metrics.add_metric(name="HoldingsSnapshotHit", unit=MetricUnit.Count, value=1)
+            return snapshot
+
+        metrics.add_metric(name="HoldingsSnapshotMiss", unit=MetricUnit.Count, value=1)
+
+        snapshot = {}
+        for stored in self._query(
+            KeyConditionExpression=Key("pk").eq(pk) & Key("sk").begins_with("SECURITY#"),
+            ProjectionExpression="#sk",
+            ExpressionAttributeNames={"#sk": "sk"},
+        ):
+            if "#ACCOUNT#" in stored["sk"]:
+                snapshot[stored["sk"]] = ""
+
+        return snapshot
+
+    def store_snapshot(
+        self, user_id: str, item_id: str, snapshot: Dict[str, str], previous: Dict[str, str]
+    ) -> None:
+        """
+        Store the holding digests for the given item, one record per account
+
+        Records of accounts in the previous snapshot that no longer hold anything
+        are deleted.
+        """
+        pk = f"USER#{user_id}#ITEM#{item_id}"
+
+        shards: Dict[str, Dict[str, str]] = {}
+        for sk, digest in snapshot.items():
+            security_id, account_id = self._split_holding_sk(sk)
+            shards.setdefault(account_id, {})[security_id] = digest
+
+        emptied: Set[str] = {self._split_holding_sk(sk)[1] for sk in previous} - set(shards)
+
+        expire_at = int(time.time()) + HOLDINGS_SNAPSHOT_TTL
+        now = utils.now_iso8601()
+
+        for account_id, holdings in shards.items():
+            params = {
+                "Key": {
+                    "pk": pk,
+                    "sk": f"{HOLDINGS_SNAPSHOT_SK_PREFIX}{account_id}",
+                },
+                "UpdateExpression": "SET #h = :h, #ttl = :ttl, #ts = :ts",
+                "ExpressionAttributeNames": {
+                    "#h": "holdings",
+                    "#ttl": "expire_at",
+                    "#ts": "updated_at",
+                },
+                "ExpressionAttributeValues": {
+                    ":h": holdings,
+                    ":ttl": expire_at,
+                    ":ts": now,
+                },
+                "ReturnValues": "NONE",
+            }
+
+            try:
+                self.dynamodb.update_item(**params)
+            except botocore.exceptions.ClientError:
+                # this account's holdings are resent until its record is stored
+                logger.exception(f"Failed to store holdings snapshot for account {account_id}")
+                metrics.add_metric(name="HoldingsSnapshotFailed", unit=MetricUnit.Count, value=1)
+
+        for account_id in emptied:
+            try:
+                self.dynamodb.delete_item(
+                    Key={
+                        "pk": pk,
+                        "sk": f"{HOLDINGS_SNAPSHOT_SK_PREFIX}{account_id}",
+                    }
+                )
+            except botocore.exceptions.ClientError:
+                logger.exception(f"Failed to delete holdings snapshot for account {account_id}")
+                metrics.add_metric(name="HoldingsSnapshotFailed", unit=MetricUnit.Count, value=1)
+
     def get_holdings(self, user_id: str, item_id: str, account_ids: List[str] = None):
         logger.info("Begin investments holdings get")
 
@@ -139,26 +311,59 @@ class InvestmentsHoldings(AbstractProduct):
             raise
 
         messages: List[Dict[str, Any]] = []
-        logger.info(f"Invstment holdings get response {response}")
+        logger.debug(f"Investment holdings get response {response}")
         accounts: List[AccountBase] = response.accounts
         if accounts:
             messages += [
                 self.build_message(user_id, item_id, entity=account) for account in accounts
             ]
 
-        holdings: List[Holding] = response.holdings
-        if holdings:
-            messages += [
-                self.build_message(user_id, item_id, entity=holding) for holding in holdings
-            ]
-
         securities: List[Security] = response.securities
         if securities:
             messages += [
                 self.build_message(user_id, item_id, entity=security) for security in securities
             ]
 
+        # only holdings that changed since the last snapshot are sent
+        previous = self.get_snapshot(user_id, item_id)
+        current: Dict[str, str] = {}
+        changed = 0
+
+        holdings: List[Holding] = response.holdings or []
+        for holding in holdings:
+            sk = f"SECURITY#{holding.security_id}#ACCOUNT#{holding.account_id}"
+            digest = hashlib.sha256(utils.json_dumps(holding.to_dict()).encode("utf-8")).hexdigest()
+            current[sk] = digest
+
+            if previous.get(sk) != digest:
+                messages.append(self.build_message(user_id, item_id, entity=holding))
+                changed += 1
+
+        # positions outside the requested accounts were not fetched, so keep them as-is
+        requested: Union[Set[str], None] = set(account_ids) if account_ids else None
+        snapshot: Dict[str, str] = {}
+        removed: List[str] = []
+        for sk, digest in previous.items():
+            if sk in current:
+                continue
+            if requested is not None and sk.split("#ACCOUNT#", 1)[1] not in requested:
+                snapshot[sk] = digest
+            else:
+                removed.append(sk)
+
+        messages += [self.build_delete_message(user_id, item_id, sk) for sk in removed]
+        snapshot.update(current)
+
+        metrics.add_metric(name="HoldingsChanged", unit=MetricUnit.Count, value=changed)
+        metrics.add_metric(
+            name="HoldingsUnchanged", unit=MetricUnit.Count, value=len(holdings) - changed
+        )
+        metrics.add_metric(name="HoldingsRemoved", unit=MetricUnit.Count, value=len(removed))
+
+        # send_messages raises unless every message was delivered, so the snapshot
+        # never records anything that did not reach the queue
         self.send_messages(messages)
+        self.store_snapshot(user_id, item_id, snapshot, previous)
 
         logger.debug("End investments holdings get")
 
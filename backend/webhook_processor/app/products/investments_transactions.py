@@ -1,11 +1,15 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import datetime
-from typing import Dict, Any, List, Union
+import os
+from typing import Dict, Any, List, Set, Union
 
-from aws_lambda_powertools import Logger, Metrics
+from aws_lambda_powertools import Logger
 from aws_lambda_powertools.metrics import MetricUnit
+from boto3.dynamodb.conditions import Attr
+import botocore
 import plaid
 from plaid.model.investments_transactions_get_request import InvestmentsTransactionsGetRequest
 from plaid.model.investments_transactions_get_request_options import (
@@ -16,13 +20,25 @@ from plaid.model.investment_transaction import InvestmentTransaction
 from plaid.model.account_base import AccountBase
 from plaid.model.security import Security
 
-from app import constants, exceptions, utils, datastore
+from app import constants, exceptions, utils, datastore, telemetry
 from app.products import AbstractProduct
 
 __all__ = ["InvestmentsTransactions"]
 
+# Maximum number of transaction pages fetched from Plaid at the same time
+INVESTMENTS_TRANSACTIONS_CONCURRENCY = int(os.getenv("INVESTMENTS_TRANSACTIONS_CONCURRENCY", "4"))
+
+# Days of history fetched when an item has no watermark yet
+INVESTMENTS_TRANSACTIONS_HISTORY_DAYS = int(
+    os.getenv("INVESTMENTS_TRANSACTIONS_HISTORY_DAYS", "730")
+)
+# Days before the watermark that are fetched again to pick up late corrections
+INVESTMENTS_TRANSACTIONS_OVERLAP_DAYS = int(
+    os.getenv("INVESTMENTS_TRANSACTIONS_OVERLAP_DAYS", "30")
+)
+
 logger = Logger(child=True)
-metrics = Metrics()
+metrics = telemetry.BufferedMetrics()
 
 
 class InvestmentsTransactions(AbstractProduct):
@@ -99,6 +115,41 @@ class InvestmentsTransactions(AbstractProduct):
 
         return message
 
+    def _get_page(
+        self,
+        access_token: str,
+        start_date: str,
+        end_date: str,
+        account_ids: Union[List[str], None],
+        offset: int = 0,
+    ) -> InvestmentsTransactionsGetResponse:
+        """
+        Fetch one page of investment transactions starting at offset
+        """
+        client_id: str = self.client.api_client.configuration.api_key["clientId"]
+        secret: str = self.client.api_client.configuration.api_key["secret"]
+
+        options = InvestmentsTransactionsGetRequestOptions(
+            count=constants.PLAID_INVESTMENTS_TRANSACTIONS_COUNT_MAX, offset=offset
+        )
+        if account_ids:
+            options.account_ids = account_ids
+
+        request = InvestmentsTransactionsGetRequest(
+            access_token=access_token,
+            secret=secret,
+            client_id=client_id,
+            start_date=start_date,
+            end_date=end_date,
+            options=options,
+        )
+
+        try:
+            return self.client.investments_transactions_get(request)
+        except plaid.ApiException:
+            logger.exception(f"Failed to call investments transactions get (offset={offset})")
+            raise
+
     def get_transactions(
         self,
         user_id: str,
@@ -106,7 +157,12 @@ class InvestmentsTransactions(AbstractProduct):
         start_date: str,
         end_date: str,
         account_ids: List[str] = None,
-    ) -> None:
+    ) -> bool:
+        """
+        Fetch and send every page of investment transactions between the given dates
+
+        Returns False if nothing was fetched because the item no longer exists.
+        """
         logger.debug("Begin investments transactions get")
 
         try:
@@ -114,86 +170,134 @@ class InvestmentsTransactions(AbstractProduct):
         except exceptions.ItemNotFoundException:
             logger.exception(f"Item {item_id} not found in DynamoDB")
             metrics.add_metric(name="ItemNotFound", unit=MetricUnit.Count, value=1)
-            return
+            return False
 
-        client_id: str = self.client.api_client.configuration.api_key["clientId"]
-        secret: str = self.client.api_client.configuration.api_key["secret"]
         access_token: str = item[constants.TOKEN_ATTRIBUTE_NAME]
 
         metrics.add_metric(
             name="PlaidInvestmentsTransactionsGetRequest", unit=MetricUnit.Count, value=1
         )
 
-        options = InvestmentsTransactionsGetRequestOptions(
-            count=constants.PLAID_INVESTMENTS_TRANSACTIONS_COUNT_MAX, account_ids=account_ids
-        )
+        response = self._get_page(access_token, start_date, end_date, account_ids)
+        total_transactions: int = response.total_investment_transactions
 
-        params = {
-            "access_token": access_token,
-            "secret": secret,
-            "client_id": client_id,
-            "start_date": start_date,
-            "end_date": end_date,
-            "options": options,
-        }
+        # securities repeat across pages, only send each one once
+        seen_security_ids: Set[str] = set()
 
-        request = InvestmentsTransactionsGetRequest(**params)
+        def page_messages(page: InvestmentsTransactionsGetResponse) -> List[Dict[str, Any]]:
+            messages: List[Dict[str, Any]] = []
 
-        try:
-            response: InvestmentsTransactionsGetResponse = self.client.investments_transactions_get(
-                request
-            )
-        except plaid.ApiException:
-            logger.exception("Failed to call investments transactions get")
-            raise
+            for security in page.securities or []:
+                if security.security_id not in seen_security_ids:
+                    seen_security_ids.add(security.security_id)
+                    messages.append(self.build_message(user_id, item_id, entity=security))
 
-        transactions: List[InvestmentTransaction] = response.investment_transactions
-        total_transactions: int = response.total_investment_transactions
+            messages += [
+                self.build_message(user_id, item_id, entity=transaction)
+                for transaction in page.investment_transactions or []
+            ]
+            return messages
+
+        messages: List[Dict[str, Any]] = [
+            self.build_message(user_id, item_id, entity=account)
+            for account in response.accounts or []
+        ]
+        messages += page_messages(response)
+        self.send_messages(messages)
 
-        while len(transactions) < total_transactions:
-            request = InvestmentsTransactionsGetRequest(
-                access_token=access_token,
-                secret=secret,
-                client_id=client_id,
-                start_date=start_date,
-                end_date=end_date,
-                options=InvestmentsTransactionsGetRequestOptions(
-                    count=constants.PLAID_INVESTMENTS_TRANSACTIONS_COUNT_MAX,
-                    offset=len(transactions),
-                ),
+        # once the total is known the remaining pages are independent of each other
+        offsets = list(
+            range(
+                len(response.investment_transactions),
+                total_transactions,
+                constants.PLAID_INVESTMENTS_TRANSACTIONS_COUNT_MAX,
             )
+        )
+        if not offsets:
+            return True
+
+        metrics.add_metric(
+            name="PlaidInvestmentsTransactionsGetRequest", unit=MetricUnit.Count, value=len(offsets)
+        )
 
-            try:
-                response: InvestmentsTransactionsGetResponse = (
-                    self.client.investments_transactions_get(request)
+        max_workers = min(INVESTMENTS_TRANSACTIONS_CONCURRENCY, len(offsets))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [
+                executor.submit(
+                    self._get_page, access_token, start_date, end_date, account_ids, offset
                 )
-            except plaid.ApiException:
-                logger.exception("Failed to call investments transactions get")
-                raise
+                for offset in offsets
+            ]
+            # messages are sent from this thread as each page arrives
+            for future in as_completed(futures):
+                self.send_messages(page_messages(future.result()))
 
-            transactions.extend(response.investment_transactions)
+        logger.debug(f"Fetched {len(offsets) + 1} pages of {total_transactions} transactions")
+        return True
 
-        messages: List[Dict[str, Any]] = []
+    def store_watermark(self, user_id: str, item_id: str, watermark: datetime.date) -> None:
+        """
+        Store the date investment transactions have been synced through for the given item
+        """
 
-        accounts: List[AccountBase] = response.accounts
-        if accounts:
-            messages += [
-                self.build_message(user_id, item_id, entity=account) for account in accounts
-            ]
+        now = utils.now_iso8601()
+        params = {
+            "Key": {
+                "pk": f"USER#{user_id}#ITEM#{item_id}",
+                "sk": "v0",
+            },
+            "UpdateExpression": "SET #w = :w, #ts = :ts",
+            "ConditionExpression": Attr("pk").exists() & Attr("sk").exists(),
+            "ExpressionAttributeNames": {
+                "#w": constants.INVESTMENTS_WATERMARK_ATTRIBUTE_NAME,
+                "#ts": "updated_at",
+            },
+            "ExpressionAttributeValues": {
+                ":w": watermark.isoformat(),
+                ":ts": now,
+            },
+            "ReturnValues": "NONE",
+        }
 
-        securities: List[Security] = response.securities
-        if securities:
-            messages += [
-                self.build_message(user_id, item_id, entity=security) for security in securities
-            ]
+        try:
+            self.dynamodb.update_item(**params)
+            logger.debug(f"Updated investments watermark to {watermark}")
+            metrics.add_metric(name="UpdateWatermarkSuccess", unit=MetricUnit.Count, value=1)
+        except botocore.exceptions.ClientError:
+            logger.exception(f"Failed to update investments watermark to {watermark}")
+            metrics.add_metric(name="UpdateWatermarkFailed", unit=MetricUnit.Count, value=1)
+
+    def sync(self, user_id: str, item_id: str) -> None:
+        """
+        Fetch investment transactions since the item's watermark, less an overlap window
 
-        if transactions:
-            messages += [
-                self.build_message(user_id, item_id, entity=transaction)
-                for transaction in transactions
-            ]
+        Items without a watermark fetch the full history window. The watermark only
+        moves forward once every page has been sent.
+        """
+        try:
+            item = datastore.get_item(user_id, item_id)
+        except exceptions.ItemNotFoundException:
+            logger.exception(f"Item {item_id} not found in DynamoDB")
+            metrics.add_metric(name="ItemNotFound", unit=MetricUnit.Count, value=1)
+            return
 
-        self.send_messages(messages)
+        end_date = datetime.date.today()
+        start_date = end_date - datetime.timedelta(days=INVESTMENTS_TRANSACTIONS_HISTORY_DAYS)
+
+        watermark: Union[str, None] = item.get(constants.INVESTMENTS_WATERMARK_ATTRIBUTE_NAME)
+        if watermark:
+            overlap_start = datetime.date.fromisoformat(watermark) - datetime.timedelta(
+                days=INVESTMENTS_TRANSACTIONS_OVERLAP_DAYS
+            )
+            start_date = max(start_date, overlap_start)
+            metrics.add_metric(name="InvestmentsIncrementalSync", unit=MetricUnit.Count, value=1)
+        else:
+            metrics.add_metric(name="InvestmentsFullSync", unit=MetricUnit.Count, value=1)
+
+        logger.info(f"Syncing investment transactions from {start_date} to {end_date}")
+
+        if self.get_transactions(user_id, item_id, start_date=start_date, end_date=end_date):
+            self.store_watermark(user_id, item_id, end_date)
 
     def handle_webhook(
         self, user_id: str, item_id: str, webhook_code: str, payload: Dict[str, Any]
@@ -213,10 +317,7 @@ class InvestmentsTransactions(AbstractProduct):
                 f"{webhook_code}, new_investments_transactions={new_investments_transactions}, canceled_investments_transactions={canceled_investments_transactions}"
             )
 
-            end_date = datetime.date.today()
-            start_date = end_date - datetime.timedelta(days=730)
-
-            self.get_transactions(user_id, item_id, start_date=start_date, end_date=end_date)
+            self.sync(user_id, item_id)
 
         else:
             logger.warn(f"Unsupported webhook code: {webhook_code}")
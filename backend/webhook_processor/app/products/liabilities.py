@@ -3,7 +3,7 @@
 
 from typing import Dict, Any, List, Union
 
-from aws_lambda_powertools import Logger, Metrics
+from aws_lambda_powertools import Logger
 from aws_lambda_powertools.metrics import MetricUnit
 import plaid
 from plaid.model.liabilities_get_request import LiabilitiesGetRequest
@@ -15,13 +15,13 @@ from plaid.model.credit_card_liability import CreditCardLiability
 from plaid.model.mortgage_liability import MortgageLiability
 from plaid.model.student_loan import StudentLoan
 
-from app import utils, exceptions, constants
+from app import utils, exceptions, constants, datastore, telemetry
 from app.products import AbstractProduct
 
 __all__ = ["Liabilities"]
 
 logger = Logger(child=True)
-metrics = Metrics()
+metrics = telemetry.BufferedMetrics()
 
 
 class Liabilities(AbstractProduct):
@@ -115,7 +115,7 @@ class Liabilities(AbstractProduct):
         logger.debug("Begin liabilities get")
 
         try:
-            item = self.get_item(user_id, item_id)
+            item = datastore.get_item(user_id, item_id)
         except exceptions.ItemNotFoundException:
             logger.exception(f"Item {item_id} not found in DynamoDB")
             metrics.add_metric(name="ItemNotFound", unit=MetricUnit.Count, value=1)
@@ -0,0 +1,31 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import threading
+from typing import Dict, Type, TypeVar
+
+from aws_lambda_powertools import Logger
+
+from app.products.abstract_product import AbstractProduct
+
+__all__ = ["get_product"]
+
+logger = Logger(child=True)
+
+T = TypeVar("T", bound=AbstractProduct)
+
+_lock = threading.Lock()
+_products: Dict[Type[AbstractProduct], AbstractProduct] = {}
+
+
+def get_product(product_class: Type[T]) -> T:
+    """
+    Return the shared instance of a product, constructing it on first use
+    """
+    with _lock:
+        product = _products.get(product_class)
+        if product is None:
+            logger.debug(f"Constructing product {product_class.__name__}")
+            product = product_class()
+            _products[product_class] = product
+        return product
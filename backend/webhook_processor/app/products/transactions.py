@@ -1,9 +1,11 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import json
+import os
 from typing import Dict, Any, List, Union
 
-from aws_lambda_powertools import Logger, Metrics
+from aws_lambda_powertools import Logger
 from aws_lambda_powertools.metrics import MetricUnit
 from boto3.dynamodb.conditions import Attr
 import botocore
@@ -14,13 +16,16 @@ from plaid.model.transactions_sync_request_options import TransactionsSyncReques
 from plaid.model.transaction import Transaction
 from plaid.model.removed_transaction import RemovedTransaction
 
-from app import utils, constants, exceptions, datastore
+from app import utils, constants, exceptions, datastore, telemetry
 from app.products import AbstractProduct
 
 __all__ = ["Transactions"]
 
+# Times a sync restarts pagination after Plaid reports a mutation before giving up
+TRANSACTIONS_SYNC_MAX_RESTARTS = int(os.getenv("TRANSACTIONS_SYNC_MAX_RESTARTS", "3"))
+
 logger = Logger(child=True)
-metrics = Metrics()
+metrics = telemetry.BufferedMetrics()
 
 
 class Transactions(AbstractProduct):
@@ -78,9 +83,14 @@ class Transactions(AbstractProduct):
 
         return message
 
-    def store_cursor(self, user_id: str, item_id: str, cursor: str) -> None:
+    def store_cursor(
+        self, user_id: str, item_id: str, cursor: str, start_cursor: Union[None, str] = None
+    ) -> None:
         """
         Store the cursor value for the given item
+
+        start_cursor is the cursor pagination began from, stored while more pages
+        remain and removed once pagination is complete.
         """
 
         now = utils.now_iso8601()
@@ -89,10 +99,11 @@ class Transactions(AbstractProduct):
                 "pk": f"USER#{user_id}#ITEM#{item_id}",
                 "sk": "v0",
             },
-            "UpdateExpression": "SET #c = :c, #ts = :ts",
+            "UpdateExpression": "SET #c = :c, #ts = :ts REMOVE #s",
             "ConditionExpression": Attr("pk").exists() & Attr("sk").exists(),
             "ExpressionAttributeNames": {
                 "#c": constants.CURSOR_ATTRIBUTE_NAME,
+                "#s": constants.CURSOR_START_ATTRIBUTE_NAME,
                 "#ts": "updated_at",
             },
             "ExpressionAttributeValues": {
@@ -101,6 +112,9 @@ class Transactions(AbstractProduct):
             },
             "ReturnValues": "NONE",
         }
+        if start_cursor is not None:
+            params["UpdateExpression"] = "SET #c = :c, #s = :s, #ts = :ts"
+            params["ExpressionAttributeValues"][":s"] = start_cursor
 
         try:
             self.dynamodb.update_item(**params)
@@ -111,6 +125,15 @@ class Transactions(AbstractProduct):
             metrics.add_metric(name="UpdateCursorFailed", unit=MetricUnit.Count, value=1)
 
     def sync(self, user_id: str, item_id: str) -> None:
+        """
+        Sync transactions for an item, one page at a time
+
+        Each page of updates is sent to SQS as soon as it is received and the
+        cursor is checkpointed afterwards, so memory stays bounded by a single
+        page and a failed sync resumes from the last fully-sent page. The cursor
+        pagination began from is checkpointed alongside it, so a resumed sync can
+        still restart pagination if Plaid reports the data changed.
+        """
         logger.debug("Begin transaction sync")
 
         try:
@@ -123,9 +146,10 @@ class Transactions(AbstractProduct):
         access_token: str = item[constants.TOKEN_ATTRIBUTE_NAME]
         cursor: Union[None, str] = item.get(constants.CURSOR_ATTRIBUTE_NAME)
 
-        added = []
-        modified = []
-        removed = []  # Removed transaction ids
+        # Plaid requires restarting pagination from the cursor that began the
+        # loop if the data changes while paginating, which an interrupted sync stored
+        start_cursor: Union[None, str] = item.get(constants.CURSOR_START_ATTRIBUTE_NAME, cursor)
+        restarts = 0
         has_more = True
 
         # Iterate through each page of new transaction updates for item
@@ -145,37 +169,68 @@ class Transactions(AbstractProduct):
             try:
                 response: TransactionsSyncResponse = self.client.transactions_sync(request)
             except plaid.ApiException as e:
-                logger.exception(e)
+                if self._is_mutation_during_pagination(e):
+                    if restarts >= TRANSACTIONS_SYNC_MAX_RESTARTS:
+                        logger.exception(
+                            f"Transactions kept changing during pagination after {restarts} restarts"
+                        )
+                        metrics.add_metric(
+                            name="PlaidTransactionSyncRestartLimit", unit=MetricUnit.Count, value=1
+                        )
+                        raise
+
+                    logger.warn("Transactions changed during pagination, restarting sync")
+                    restarts += 1
+                    metrics.add_metric(
+                        name="PlaidTransactionSyncRestart", unit=MetricUnit.Count, value=1
+                    )
+                    cursor = start_cursor
+                    continue
+
+                # raise so SQS retries the record rather than dropping the sync
                 logger.exception("Failed to call transactions sync")
-                return
-
-            # Add this page of results
-            added.extend(response["added"])
-            modified.extend(response["modified"])
-            removed.extend(response["removed"])
+                raise
+
+            messages = (
+                [
+                    self.build_message(user_id, item_id, "INSERT", transaction)
+                    for transaction in response["added"]
+                ]
+                + [
+                    self.build_message(user_id, item_id, "MODIFY", transaction)
+                    for transaction in response["modified"]
+                ]
+                + [
+                    self.build_message(user_id, item_id, "REMOVE", transaction)
+                    for transaction in response["removed"]
+                ]
+            )
             has_more = response["has_more"]
 
             # Update cursor to the next cursor
             cursor = response["next_cursor"]
 
-        added = [
-            self.build_message(user_id, item_id, "INSERT", transaction) for transaction in added
-        ]
-        modified = [
-            self.build_message(user_id, item_id, "MODIFY", transaction) for transaction in modified
-        ]
-        removed = [
-            self.build_message(user_id, item_id, "REMOVE", transaction) for transaction in removed
-        ]
-
-        all_transactions = added + modified + removed
-        if all_transactions:
-            self.send_messages(all_transactions)
+            if messages:
+                self.send_messages(messages)
 
-        self.store_cursor(user_id, item_id, cursor)
+            # Only checkpoint once every message in the page has been sent. An empty
+            # start cursor means pagination began from the start of the item's history
+            self.store_cursor(user_id, item_id, cursor, (start_cursor or "") if has_more else None)
 
         logger.debug("End transaction sync")
 
+    @staticmethod
+    def _is_mutation_during_pagination(error: plaid.ApiException) -> bool:
+        """
+        Return whether a Plaid error was caused by data changing while paginating
+        """
+        try:
+            body: Dict[str, Any] = json.loads(error.body or "{}")
+        except (TypeError, ValueError):
+            return False
+
+        return body.get("error_code") == "TRANSACTIONS_SYNC_MUTATION_DURING_PAGINATION"
+
     def handle_webhook(
         self, user_id: str, item_id: str, webhook_code: str, payload: Dict[str, Any]
     ) -> None:
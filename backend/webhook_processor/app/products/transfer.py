@@ -1,26 +1,24 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-from typing import Dict, Any, List, Union
+import json
+import time
+from typing import Dict, Any, List
 
-from aws_lambda_powertools import Logger, Metrics
+from aws_lambda_powertools import Logger
 from aws_lambda_powertools.metrics import MetricUnit
 from boto3.dynamodb.conditions import Attr
 import botocore
-import plaid
-from plaid.model.transactions_sync_request import TransactionsSyncRequest
-from plaid.model.transactions_sync_response import TransactionsSyncResponse
-from plaid.model.transactions_sync_request_options import TransactionsSyncRequestOptions
-from plaid.model.transaction import Transaction
-from plaid.model.removed_transaction import RemovedTransaction
-import json
-from app import utils, constants, exceptions, datastore
+from plaid.model.transfer_event_sync_request import TransferEventSyncRequest
+from plaid.model.transfer_event_sync_response import TransferEventSyncResponse
+
+from app import utils, constants, exceptions, datastore, telemetry
 from app.products import AbstractProduct
 
-__all__ = ["Transactions"]
+__all__ = ["Transfer"]
 
 logger = Logger(child=True)
-metrics = Metrics()
+metrics = telemetry.BufferedMetrics()
 PAYMENT_STATUS = {
     "NEW": "new",
     "INTENT_PENDING": "intent_pending",
@@ -45,20 +43,26 @@ EXPECTED_NEXT_STATES = {
     "settled": ["returned"],
 }
 
+# The states a payment may be in before moving to each state
+EXPECTED_PREVIOUS_STATES = {
+    status: [previous for previous, nexts in EXPECTED_NEXT_STATES.items() if status in nexts]
+    for status in PAYMENT_STATUS.values()
+}
+
+
 class Transfer(AbstractProduct):
-    def store_cursor(self, cursor: str) -> None:
+    def store_cursor(self, cursor: int) -> None:
         """
-        Store the cursor value for the given item
+        Store the last transfer event ID that has been processed
         """
 
         now = utils.now_iso8601()
         params = {
             "Key": {
-                "pk": f"TRANSFER_LAST_READ",
+                "pk": "TRANSFER_LAST_READ",
                 "sk": "v0",
             },
             "UpdateExpression": "SET #c = :c, #ts = :ts",
-            "ConditionExpression": Attr("pk").exists() & Attr("sk").exists(),
             "ExpressionAttributeNames": {
                 "#c": constants.CURSOR_TRANSFER_ATTRIBUTE_NAME,
                 "#ts": "updated_at",
@@ -78,102 +82,158 @@ class Transfer(AbstractProduct):
             logger.exception(f"Failed to update cursor to {cursor}")
             metrics.add_metric(name="UpdateCursorFailed", unit=MetricUnit.Count, value=1)
 
-    def store_transfer(self, transfer_id: str, last_event_body: str, status: str) -> None:
+    def store_transfer(self, transfer_id: str, last_event_body: str, status: str) -> bool:
         """
-        Store the cursor value for the given item
+        Move a payment to a new status, if its current status allows it
+
+        Returns False when the payment was not in one of the expected previous states.
         """
 
         now = utils.now_iso8601()
         params = {
             "Key": {
                 "pk": "TRANSFER",
-                "sk": f"TRANSFER#${transfer_id}",
+                "sk": f"TRANSFER#{transfer_id}",
             },
-            "UpdateExpression": "SET #c = :c, #ts = :ts",
-            "ConditionExpression": Attr("pk").exists() & Attr("sk").exists(),
+            "UpdateExpression": "SET #c = :c, #ts = :ts, #d = :d",
+            "ConditionExpression": Attr("pk").exists()
+            & Attr("sk").exists()
+            & Attr("status").is_in(EXPECTED_PREVIOUS_STATES[status]),
             "ExpressionAttributeNames": {
                 "#c": "last_event_body",
                 "#ts": "updated_at",
-                "#d": "status"
+                "#d": "status",
             },
             "ExpressionAttributeValues": {
                 ":c": last_event_body,
                 ":ts": now,
-                ":d": status
+                ":d": status,
             },
             "ReturnValues": "NONE",
         }
 
         try:
             self.dynamodb.update_item(**params)
-            logger.info(f"Updated transfer {transfer_id}")
-            metrics.add_metric(name="UpdateTransferSuccess", unit=MetricUnit.Count, value=1)
-        except botocore.exceptions.ClientError:
+        except botocore.exceptions.ClientError as error:
+            if error.response["Error"]["Code"] == "ConditionalCheckFailedException":
+                logger.warn(f"Payment {transfer_id} cannot move to {status}, skipping")
+                metrics.add_metric(
+                    name="TransferTransitionRejected", unit=MetricUnit.Count, value=1
+                )
+                return False
+
             logger.exception(f"Failed to update transfer to {transfer_id}")
             metrics.add_metric(name="UpdateTransferFailed", unit=MetricUnit.Count, value=1)
+            raise
 
-    def process_payment_event(self, event) -> None:
-        logger.info("Begin transfers sync")
-        existing_payment = datastore.get_transfer(event["transfer_id"])
-        if not existing_payment:
-            print(f"Could not find a payment with ID {event['transfer_id']}. It might belong to another application.")
-            return
-
-        print(f"Found payment {existing_payment}")
-
-        # Validate if the event type exists in PAYMENT_STATUS
-        if event["event_type"] not in PAYMENT_STATUS.values():
-            print(f"Unknown event type {event['event_type']}")
-            return
-
-        print(f"The payment went from {existing_payment['status']} to {event['event_type']}!")
-
-        # Check if the current status is valid in EXPECTED_NEXT_STATES
-        if EXPECTED_NEXT_STATES.get(existing_payment["status"]) is None:
-            print("Hmm... existing payment has a status I don't recognize")
-            return
-
-        # Validate if the transition from current status to the event's status is allowed
-        if event["event_type"] not in EXPECTED_NEXT_STATES[existing_payment["status"]]:
-            print(f"Not sure why a {existing_payment['status']} payment is going to a {event['event_type']} state. Skipping.")
-            return
-        # Update DB to new status
-        self.store_transfer(transfer_id=event["transfer_id"], last_event_body=json.dumps(event), status=event['status'])
-
-    def handle_webhook(
-        self
-    ) -> None:
+        logger.info(f"Updated transfer {transfer_id} to {status}")
+        metrics.add_metric(name="UpdateTransferSuccess", unit=MetricUnit.Count, value=1)
+        return True
+
+    def get_statuses(self, transfer_ids: List[str]) -> Dict[str, str]:
+        """
+        Return the current status of each known payment, in as few reads as possible
+        """
+        statuses: Dict[str, str] = {}
+        table_name = self.dynamodb.name
+        client = self.dynamodb.meta.client
+
+        for chunk in utils.chunk_list(transfer_ids, constants.DYNAMODB_BATCH_GET_ITEM_MAX):
+            request_items: Dict[str, Any] = {
+                table_name: {
+                    "Keys": [{"pk": "TRANSFER", "sk": f"TRANSFER#{t}"} for t in chunk],
+                    "ProjectionExpression": "#sk, #status",
+                    "ExpressionAttributeNames": {"#sk": "sk", "#status": "status"},
+                }
+            }
+
+            attempt = 0
+            while request_items:
+                if attempt:
+                    time.sleep(min(0.05 * 2**attempt, 2))
+                attempt += 1
+
+                try:
+                    response = client.batch_get_item(RequestItems=request_items)
+                except botocore.exceptions.ClientError:
+                    logger.exception("Failed to get transfers from DynamoDB")
+                    raise
+
+                for item in response.get("Responses", {}).get(table_name, []):
+                    statuses[item["sk"].replace("TRANSFER#", "", 1)] = item.get("status")
+
+                request_items = response.get("UnprocessedKeys", {})
+
+        return statuses
+
+    def process_payment_events(self, events: List[Dict[str, Any]]) -> None:
+        """
+        Apply a page of transfer events, in event order, to the stored payments
+        """
+        statuses = self.get_statuses(list(dict.fromkeys(e["transfer_id"] for e in events)))
+
+        for event in events:
+            transfer_id: str = event["transfer_id"]
+            event_type: str = event["event_type"]
+
+            status = statuses.get(transfer_id)
+            if status is None:
+                logger.info(
+                    f"Could not find a payment with ID {transfer_id}. It might belong to another application."
+                )
+                continue
+
+            # Validate if the event type exists in PAYMENT_STATUS
+            if event_type not in PAYMENT_STATUS.values():
+                logger.warn(f"Unknown event type {event_type}")
+                continue
+
+            # Validate if the transition from current status to the event's status is allowed
+            if event_type not in EXPECTED_NEXT_STATES.get(status, []):
+                logger.warn(
+                    f"Not sure why a {status} payment is going to a {event_type} state. Skipping."
+                )
+                continue
+
+            # the condition on the write guards against a concurrent update since the read
+            if self.store_transfer(
+                transfer_id=transfer_id,
+                last_event_body=json.dumps(event, default=str),
+                status=event_type,
+            ):
+                statuses[transfer_id] = event_type
+
+    def handle_webhook(self) -> None:
         """
-        Handle transaction webhooks
+        Handle transfer webhooks by syncing every transfer event since the last one processed
         """
-        logger.info("Handling transaction web hook")
+        logger.info("Handling transfer webhook")
         try:
-            cursor_last_read = datastore.get_transfer_last_read().get(constants.CURSOR_TRANSFER_ATTRIBUTE_NAME)
+            cursor: int = int(
+                datastore.get_transfer_last_read().get(constants.CURSOR_TRANSFER_ATTRIBUTE_NAME, 0)
+            )
         except exceptions.ItemNotFoundException:
-            logger.exception(f"Items not found in DynamoDB")
-            metrics.add_metric(name="ItemNotFound", unit=MetricUnit.Count, value=1)
-            cursor_last_read = 0
-
-        fetch_more = True
-        while fetch_more:
-            # Fetch the next batch of transfer events
-            next_batch = self.client.transfer_event_sync({
-                "after_id": cursor_last_read,
-                "count": 20,
-            })
-            logger.info("Fetched next batch")
-
-            # Sort the transfer events by event_id
-            sorted_events = sorted(next_batch.data["transfer_events"], key=lambda event: event["event_id"])
-
-            # Process each event
-            for event in sorted_events:
-                try: 
-                    self.process_payment_event(event)
-                except Exception:
-                    logger.exception("Failed to proceess payment")
-                cursor_last_read = event["event_id"]
-
-            # Check if more events need to be fetched
-            fetch_more = next_batch.data["has_more"]
-        self.store_cursor(cursor=cursor_last_read)
\ No newline at end of file
+            logger.info("No transfer cursor found, syncing from the first event")
+            cursor = 0
+
+        count = constants.PLAID_TRANSFER_EVENT_SYNC_COUNT_MAX
+        has_more = True
+        while has_more:
+            request = TransferEventSyncRequest(after_id=cursor, count=count)
+            response: TransferEventSyncResponse = self.client.transfer_event_sync(request)
+
+            events: List[Dict[str, Any]] = sorted(
+                (event.to_dict() for event in response.transfer_events),
+                key=lambda event: event["event_id"],
+            )
+            metrics.add_metric(name="TransferEventCount", unit=MetricUnit.Count, value=len(events))
+            logger.info(f"Fetched {len(events)} transfer events after {cursor}")
+
+            if events:
+                self.process_payment_events(events)
+
+                # checkpoint every page so a failure only replays the current one
+                cursor = events[-1]["event_id"]
+                self.store_cursor(cursor=cursor)
+
+            has_more = response.get("has_more", len(events) == count)
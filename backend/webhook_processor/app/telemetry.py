@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from contextlib import contextmanager
+import threading
+from typing import Any, Dict, Iterator, List, Union
+
+from aws_lambda_powertools import Metrics
+from aws_lambda_powertools.metrics import MetricResolution, MetricUnit
+
+__all__ = ["BufferedMetrics", "collect_metrics"]
+
+# Metrics held back on the current thread, while it is collecting them
+_collecting = threading.local()
+
+
+class BufferedMetrics(Metrics):
+    """
+    Metrics that are held back while the current thread is collecting them
+
+    Powertools metrics are not thread-safe, so worker threads run inside
+    collect_metrics and the calling thread passes what they collected to add_metrics.
+    """
+
+    def add_metric(
+        self,
+        name: str,
+        unit: Union[MetricUnit, str],
+        value: float,
+        resolution: Union[MetricResolution, int] = 60,
+    ) -> None:
+        collected: Union[List[Dict[str, Any]], None] = getattr(_collecting, "metrics", None)
+        if collected is not None:
+            collected.append({"name": name, "unit": unit, "value": value, "resolution": resolution})
+            return
+
+        super().add_metric(name=name, unit=unit, value=value, resolution=resolution)
+
+    def add_metrics(self, collected: List[Dict[str, Any]]) -> None:
+        """
+        Add metrics collected on another thread
+        """
+        for metric in collected:
+            self.add_metric(**metric)
+
+
+@contextmanager
+def collect_metrics() -> Iterator[List[Dict[str, Any]]]:
+    """
+    Hold back the metrics added on this thread, yielding the list they are added to
+    """
+    previous = getattr(_collecting, "metrics", None)
+    _collecting.metrics = collected = []
+    try:
+        yield collected
+    finally:
+        _collecting.metrics = previous
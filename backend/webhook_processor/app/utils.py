@@ -1,29 +1,59 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import base64
+from collections import OrderedDict
 import datetime
 import decimal
 import json
-from typing import Generator, List, Any
+from typing import Generator, List, Any, Dict, Hashable, Union
 import os
+import threading
+import time
 import uuid
+import zlib
 
-from aws_lambda_powertools import Logger, Metrics
+from aws_lambda_powertools import Logger
 from aws_lambda_powertools.metrics import MetricUnit
 from aws_lambda_powertools.utilities import parameters
 import plaid
 from plaid.api import plaid_api
 
-from app import constants
+from app import constants, telemetry
 
-__all__ = ["get_plaid_client", "json_dumps", "chunk_list", "now_iso8601", "today", "generate_id"]
+__all__ = [
+    "LRUCache",
+    "get_plaid_client",
+    "json_dumps",
+    "chunk_list",
+    "message_size",
+    "compress_message",
+    "pack_messages",
+    "now_iso8601",
+    "today",
+    "generate_id",
+]
 
 PLAID_SECRET_ARN = os.getenv("PLAID_SECRET_ARN")
+# How long (in seconds) the Plaid credentials are used before being re-fetched
+PLAID_SECRET_MAX_AGE = float(os.getenv("PLAID_SECRET_MAX_AGE", "900"))
+# How long (in seconds) to keep the current credentials after a failed re-fetch
+PLAID_SECRET_RETRY_INTERVAL = float(os.getenv("PLAID_SECRET_RETRY_INTERVAL", "30"))
+# Maximum connections kept open in the pool shared by every Plaid API call
+PLAID_CONNECTION_POOL_SIZE = int(os.getenv("PLAID_CONNECTION_POOL_SIZE", "16"))
 
 logger = Logger(child=True)
-metrics = Metrics()
+metrics = telemetry.BufferedMetrics()
 secrets_provider = parameters.SecretsProvider(config=constants.BOTO3_CONFIG)
 
+# Sentinel for cache lookups, since None can be a cached value
+_MISSING = object()
+
+_plaid_client_lock = threading.Lock()
+_plaid_client: Union[plaid_api.PlaidApi, None] = None
+_plaid_credentials: Union[Dict[str, str], None] = None
+_plaid_credentials_fetched_at = 0.0
+
 
 class Encoder(json.JSONEncoder):
     """
@@ -43,26 +73,103 @@ class Encoder(json.JSONEncoder):
             return super().default(obj)
 
 
+class LRUCache:
+    """
+    Thread-safe least recently used cache whose entries expire after a TTL (in seconds)
+    """
+
+    def __init__(self, max_size: int = 128, ttl: float = 60) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return default
+
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Union[float, None] = None) -> None:
+        if ttl is None:
+            ttl = self.ttl
+
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
 def get_plaid_client() -> plaid_api.PlaidApi:
-    try:
-        credentials = secrets_provider.get(PLAID_SECRET_ARN, transform="json")
-        metrics.add_metric(name="FetchSecretSuccess", unit=MetricUnit.Count, value=1)
-    except Exception:
-        logger.exception(f"Unable to get secret value from {PLAID_SECRET_ARN}")
-        metrics.add_metric(name="FetchSecretFailed", unit=MetricUnit.Count, value=1)
-        raise
-
-    configuration = plaid.Configuration(
-        host=credentials["endpoint"],
-        api_key={
-            "clientId": credentials["client_id"],
-            "secret": credentials["client_secret"],
-        },
-    )
-    api_client = plaid.ApiClient(configuration)
-    client = plaid_api.PlaidApi(api_client)
+    """
+    Return the process-wide Plaid client, building it on first use
+
+    The credentials are re-fetched once they are older than PLAID_SECRET_MAX_AGE
+    and the client (with its connection pool) is only rebuilt if they changed. A
+    failed re-fetch is retried after PLAID_SECRET_RETRY_INTERVAL.
+    """
+    global _plaid_client, _plaid_credentials, _plaid_credentials_fetched_at
 
-    return client
+    with _plaid_client_lock:
+        age = time.monotonic() - _plaid_credentials_fetched_at
+        if _plaid_client is not None and age < PLAID_SECRET_MAX_AGE:
+            return _plaid_client
+
+        try:
+            credentials = secrets_provider.get(PLAID_SECRET_ARN, transform="json", force_fetch=True)
+            metrics.add_metric(name="FetchSecretSuccess", unit=MetricUnit.Count, value=1)
+        except Exception:
+            logger.exception(f"Unable to get secret value from {PLAID_SECRET_ARN}")
+            metrics.add_metric(name="FetchSecretFailed", unit=MetricUnit.Count, value=1)
+            if _plaid_client is None:
+                raise
+            # keep using the existing client, and back off before trying to refresh again
+            _plaid_credentials_fetched_at = (
+                time.monotonic() - PLAID_SECRET_MAX_AGE + PLAID_SECRET_RETRY_INTERVAL
+            )
+            return _plaid_client
+
+        _plaid_credentials_fetched_at = time.monotonic()
+
+        if _plaid_client is None or credentials != _plaid_credentials:
+            configuration = plaid.Configuration(
+                host=credentials["endpoint"],
+                api_key={
+                    "clientId": credentials["client_id"],
+                    "secret": credentials["client_secret"],
+                },
+            )
+            configuration.connection_pool_maxsize = PLAID_CONNECTION_POOL_SIZE
+            api_client = plaid.ApiClient(configuration)
+
+            _plaid_client = plaid_api.PlaidApi(api_client)
+            _plaid_credentials = credentials
+
+        return _plaid_client
 
 
 def json_dumps(obj: Any) -> str:
@@ -77,6 +184,62 @@ def chunk_list(lst: List[Any], size: int = 3) -> Generator[list, None, None]:
         yield lst[i : i + size]
 
 
+def message_size(message: Dict[str, Any]) -> int:
+    """
+    Return the size in bytes SQS counts towards the payload limit for a message
+    """
+    size = len(message["MessageBody"].encode("utf-8"))
+    for name, attribute in message.get("MessageAttributes", {}).items():
+        size += len(name.encode("utf-8")) + len(attribute["DataType"].encode("utf-8"))
+        if "StringValue" in attribute:
+            size += len(attribute["StringValue"].encode("utf-8"))
+        elif "BinaryValue" in attribute:
+            size += len(attribute["BinaryValue"])
+    return size
+
+
+def compress_message(message: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Return a copy of the message with a zlib compressed, base64 encoded body
+    """
+    body = zlib.compress(message["MessageBody"].encode("utf-8"))
+
+    compressed = dict(message)
+    compressed["MessageBody"] = base64.b64encode(body).decode("ascii")
+    compressed["MessageAttributes"] = dict(message.get("MessageAttributes", {}))
+    compressed["MessageAttributes"][constants.SQS_CONTENT_ENCODING_ATTRIBUTE_NAME] = {
+        "StringValue": constants.SQS_CONTENT_ENCODING_ZLIB,
+        "DataType": "String",
+    }
+    return compressed
+
+
+def pack_messages(
+    messages: List[Dict[str, Any]],
+    max_count: int = constants.SQS_SEND_MESSAGE_BATCH_MAX,
+    max_bytes: int = constants.SQS_SEND_MESSAGE_BATCH_BYTES_MAX,
+) -> Generator[List[Dict[str, Any]], None, None]:
+    """
+    Greedily pack messages into batches that respect both the SQS entry count and
+    total payload size limits. Every message must already fit within max_bytes.
+    """
+    batch: List[Dict[str, Any]] = []
+    batch_bytes = 0
+
+    for message in messages:
+        size = message_size(message)
+        if batch and (len(batch) >= max_count or batch_bytes + size > max_bytes):
+            yield batch
+            batch = []
+            batch_bytes = 0
+
+        batch.append(message)
+        batch_bytes += size
+
+    if batch:
+        yield batch
+
+
 def now_iso8601() -> str:
     """
     Return the current date/time as a ISO8601 timestamp (YYYY-MM-DDTHH:MI:SSZ)